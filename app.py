@@ -1,11 +1,11 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import requests
 import os
 import io
 import base64
 from werkzeug.utils import secure_filename
-from PIL import Image
+from PIL import Image, ImageOps
 import numpy as np
 # TensorFlow imports moved to load_models_if_needed() to avoid startup delay
 import cv2
@@ -15,11 +15,15 @@ import json
 import calendar
 import math
 import uuid
+import threading
+import time
+import zipfile
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait
 from werkzeug.security import check_password_hash, generate_password_hash
 from bson import ObjectId
 from bson.objectid import ObjectId
 import pickle
-import pandas as pd
 import google.generativeai as genai
 from pymongo import MongoClient
 import traceback
@@ -45,8 +49,9 @@ orders_collection = None
 
 try:
     if MONGO_URI:
-        # Create MongoDB client (doesn't connect yet - lazy connection)
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        # Create MongoDB client (doesn't connect yet - lazy connection). connect=False also
+        # keeps its monitor threads and sockets out of a gunicorn master that forks workers
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connect=False)
         
         # Get database
         db = client.agrishield
@@ -148,7 +153,7 @@ from models import (
     create_schedule, get_schedule_by_farm_id, update_task_status,
     save_weather_data, get_latest_weather,
     create_alert, get_alerts_by_user, mark_alert_as_read, delete_alert,
-    grape_varieties_collection, db,
+    grape_varieties_collection, db, init_grape_varieties,
     get_grape_varieties, get_variety_info,
     create_plant_note, get_plant_notes_by_farm, get_plant_note,
     update_plant_note, delete_plant_note,
@@ -162,7 +167,22 @@ from models import (
 )
 from utils import (
     get_weather_data, get_weather_data_by_coords, generate_farming_timeline, calculate_farm_layout,
-    get_seasonal_activities, generate_pdf_plan, get_gemini_recommendation
+    get_seasonal_activities, generate_pdf_plan, get_gemini_recommendation, get_forecast_data
+)
+from batching import MicroBatcher
+import http_client
+from inference import (
+    load_inference_model, dense_weights_path, tflite_path, NumpyDenseModel, TFLiteModel, GRAPE_MODEL_VARIANT, MODEL_BACKEND
+)
+from prediction_cache import PredictionCache, image_key, model_identity, PREDICTION_CACHE_BACKEND
+from inference_service import INFERENCE_SERVICE_ADDRESS, InferenceClient, InferenceServiceError, RemoteModel
+from tta import TTA_MODE, TTA_CONFIDENCE_THRESHOLD, TTA_VIEW_NAMES, needs_tta, tta_predict
+from variety_model import CompiledVarietyModel
+from llm_cache import TextCache, LLM_CACHE_BACKEND, LLM_CACHE_DIR
+from chat_cache import ChatCache
+from disease_risk import (
+    DISEASE_CLASSES, RISK_GRID_PATH, RISK_GRID_SOURCES, WEATHER_FEATURES, RiskGrid, forecast_risk,
+    iter_disease_predictions, observations_to_array, predict_disease_probabilities, read_observations_csv
 )
 # Set environment variable to disable OneDNN optimizations to avoid warnings
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
@@ -176,24 +196,85 @@ modelgrape = None
 weather_model = None
 scaler = None
 encoder = None
+grape_batcher = None
+risk_grid = None
+
+# Repeated leaf photos are answered from this cache instead of the model
+prediction_cache = PredictionCache(
+    collection=db.prediction_cache if PREDICTION_CACHE_BACKEND == 'mongo' else None
+)
+
+# The grape model file this configuration runs (the inference service runs the same one)
+if GRAPE_MODEL_VARIANT == 'int8':
+    GRAPE_MODEL_FILE = tflite_path('grape_model.h5', variant='int8')
+elif MODEL_BACKEND == 'tflite':
+    GRAPE_MODEL_FILE = tflite_path('grape_model.h5')
+else:
+    GRAPE_MODEL_FILE = 'grape_model.h5'
+# Part of every prediction cache key, so the shared tier never mixes models or TTA settings
+GRAPE_MODEL_ID = model_identity(
+    [GRAPE_MODEL_VARIANT, MODEL_BACKEND, TTA_MODE, TTA_CONFIDENCE_THRESHOLD], paths=[GRAPE_MODEL_FILE]
+)
+
+# With INFERENCE_SERVICE_ADDRESS set, the models run in inference_service.py instead of the web workers
+inference_client = InferenceClient() if INFERENCE_SERVICE_ADDRESS else None
+
+# Requests arriving while the warm start is loading wait for it instead of loading twice
+_models_lock = threading.RLock()
 
 # Lazy load models function
-def load_models_if_needed():
+def load_models_if_needed(warmup=True):
     """Load models only when first needed to reduce startup time and memory"""
-    global model, modelgrape, weather_model, scaler, encoder
+    if grape_batcher is None:
+        with _models_lock:
+            _load_grape_model(warmup)
+    load_weather_model_if_needed(warmup)
+
+def load_weather_model_if_needed(warmup=True):
+    """Load only what /predict_disease needs (no TensorFlow once the .npz export exists)"""
+    # encoder is loaded last, so once it is set everything else is too
+    if encoder is None:
+        with _models_lock:
+            _load_weather_model(warmup)
+
+def _load_grape_model(warmup):
+    global model, modelgrape, grape_batcher
     
-    # Import TensorFlow only when needed (avoids 30s startup delay)
-    from tensorflow.keras.models import load_model
+    # TensorFlow is only imported by the keras backend (avoids 30s startup delay)
+    # Models are inference-only: no optimizer compile, traced graph instead of model.predict
+    if model is None and inference_client is not None:
+        model = RemoteModel(inference_client, 'grape', name='grape_model')
     
     if model is None:
         print("Loading grape_model.h5...")
-        model = load_model("grape_model.h5")
-        model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        model = load_inference_model("grape_model.h5", name='grape_model', variant=GRAPE_MODEL_VARIANT, warmup=warmup)
         print("grape_model.h5 loaded successfully")
     
+    if grape_batcher is None:
+        if isinstance(model, RemoteModel):
+            # The inference service batches across every web worker, and each request thread
+            # waits on its own call (with the client's timeout) instead of queueing behind one
+            grape_batcher = model
+        else:
+            # Concurrent /predict and /capture calls share one batched forward pass
+            grape_batcher = MicroBatcher(model.predict, name='grape_model')
+    
+    # modelgrape remains None (Apple disease model disabled)
+
+def _load_weather_model(warmup):
+    global weather_model, scaler, encoder, risk_grid
+    
+    # The dense-layer export is evaluated with NumPy in microseconds, in-process
+    if weather_model is None and os.path.exists(dense_weights_path('grape_leaf_disease_model.h5')):
+        weather_model = load_inference_model('grape_leaf_disease_model.h5', name='weather_model', backend='numpy')
+        print("grape_leaf_disease_model.npz loaded (NumPy evaluator)")
+    
+    if weather_model is None and inference_client is not None:
+        weather_model = RemoteModel(inference_client, 'weather', name='weather_model')
+    
     if weather_model is None:
         print("Loading grape_leaf_disease_model.h5...")
-        weather_model = load_model('grape_leaf_disease_model.h5')
+        weather_model = load_inference_model('grape_leaf_disease_model.h5', name='weather_model', warmup=warmup)
         print("grape_leaf_disease_model.h5 loaded successfully")
     
     if scaler is None:
@@ -201,12 +282,70 @@ def load_models_if_needed():
         scaler = joblib.load('scaler.pkl')
         print("scaler.pkl loaded successfully")
     
+    # Precomputed by build_risk_grid.py; ignored once the model or scaler it came from changes.
+    # A grid lookup beats a TensorFlow/TFLite call but not the NumPy evaluator, so it is only used without it
+    if risk_grid is None and os.path.exists(RISK_GRID_PATH) and not isinstance(weather_model, NumpyDenseModel):
+        try:
+            grid = RiskGrid(RISK_GRID_PATH)
+            if grid.is_current(RISK_GRID_SOURCES):
+                risk_grid = grid
+                print(f"{RISK_GRID_PATH} mapped ({grid.stats()['points']:,} grid points)")
+            else:
+                print(f"{RISK_GRID_PATH} is out of date, run build_risk_grid.py again; using the model only")
+        except Exception as e:
+            print(f"Error loading {RISK_GRID_PATH}: {e}")
+    
     if encoder is None:
         print("Loading label_encoder.pkl...")
         encoder = joblib.load('label_encoder.pkl')
         print("label_encoder.pkl loaded successfully")
+
+def preload_models_for_fork():
+    """
+    Load every model in the gunicorn master (PRELOAD_MODELS=true) so forked
+    workers share them copy-on-write instead of each loading its own copy.
+    """
+    # TensorFlow's thread pools don't survive fork(), so only the TFLite backend can be
+    # loaded pre-fork. Its weights are mmapped from the .tflite file and shared by every
+    # worker; each worker opens its own interpreter over the same mapping on first use.
+    if MODEL_BACKEND != 'tflite':
+        print("PRELOAD_MODELS needs MODEL_BACKEND=tflite (TensorFlow is not fork-safe); models will load in each worker")
+        return False
     
-    # modelgrape remains None (Apple disease model disabled)
+    # No warmup here: nothing should be invoked in the master before the fork
+    load_models_if_needed(warmup=False)
+    load_grape_model()
+    # Workers can't use the master's interpreters, so don't keep their tensor arenas around
+    for loaded in (model, weather_model):
+        if isinstance(loaded, TFLiteModel):
+            loaded.close()
+    print("Models preloaded in the master process, shared copy-on-write with workers")
+    return True
+
+def warm_start(boot_time=None):
+    """
+    Load and exercise every model in a background thread when a worker boots,
+    so no user request is served by a cold model. Logs time-to-first-prediction.
+    """
+    boot_time = boot_time or time.time()
+    
+    def run():
+        try:
+            init_database()
+            load_models_if_needed()
+            load_grape_model()
+            # One dummy request down the same path /predict and /predict_disease take
+            grape_batcher.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+            weather_model.predict(scaler.transform(np.zeros((1, 5))))
+            print(f"Worker {os.getpid()} warm: time-to-first-prediction {time.time() - boot_time:.2f}s")
+            # Cache lookups for every variety text only once the models answer
+            prewarm_variety_texts()
+        except Exception as e:
+            print(f"Warm start failed, models will load on first request: {e}")
+    
+    thread = threading.Thread(target=run, name='warm-start', daemon=True)
+    thread.start()
+    return thread
 
 # Class labels for grape diseases
 class_names = ['Black Rot', 'Leaf Blight', 'Healthy', 'ESCA']
@@ -290,79 +429,128 @@ if not os.path.exists(UPLOAD_FOLDERG):
     os.makedirs(UPLOAD_FOLDERG)
 app.config['UPLOAD_FOLDERG'] = UPLOAD_FOLDERG
 
-def preprocess_image(image_path, target_size=(224, 224)):
+# Uploads are decoded in memory; keeping a copy on disk is optional
+SAVE_UPLOADS = os.getenv('SAVE_UPLOADS', 'false').lower() == 'true'
+upload_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-writer')
+
+def decode_image_bytes(image_bytes):
+    """Decode an uploaded image once into an RGB uint8 array (None if unreadable)"""
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        return np.asarray(img.convert('RGB'))
+    except Exception as e:
+        print(f"Could not decode uploaded image: {e}")
+        return None
+
+def _write_upload(filepath, image_bytes):
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(image_bytes)
+    except Exception as e:
+        print(f"Error saving upload {filepath}: {e}")
+
+def save_upload_async(image_bytes, filename):
+    """Write the raw upload to UPLOAD_FOLDER in the background when SAVE_UPLOADS is on"""
+    if not SAVE_UPLOADS:
+        return None
+    # Unique names so concurrent uploads never overwrite each other
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{secure_filename(filename)}")
+    upload_writer.submit(_write_upload, filepath, image_bytes)
+    return filepath
+
+def preprocess_image(image, target_size=(224, 224)):
+    """Resize and scale an image (file path or decoded RGB array) into a 1x224x224x3 batch"""
     # Use PIL instead of TensorFlow for image loading
-    from PIL import Image
-    img = Image.open(image_path).resize(target_size)
+    if isinstance(image, np.ndarray):
+        img = Image.fromarray(image)
+    else:
+        img = Image.open(image).convert('RGB')
+    img = img.resize(target_size)
     x = np.array(img, dtype='float32')
     x = x / 255.
     x = np.expand_dims(x, axis=0)
     return x
 
-def is_grape_leaf_image(image_path):
+# Images are downsampled to this longest edge before the colour analysis
+LEAF_CHECK_MAX_EDGE = 256
+
+# Saturation / value thresholds used by the colour ranges below. Every pixel
+# is binned by hue (0-179) and by which of these thresholds it clears, so one
+# histogram answers all the range checks at once.
+_LEAF_S_EDGES = np.array([20, 30, 50, 70])
+_LEAF_V_EDGES = np.array([30, 50, 70])
+_LEAF_S_BIN = np.searchsorted(_LEAF_S_EDGES, np.arange(256), side='right').astype(np.intp)
+_LEAF_V_BIN = np.searchsorted(_LEAF_V_EDGES, np.arange(256), side='right').astype(np.intp)
+_LEAF_HIST_SHAPE = (180, len(_LEAF_S_EDGES) + 1, len(_LEAF_V_EDGES) + 1)
+
+def _hsv_range(h_min, h_max, s_min, v_min):
+    """Histogram cells covered by an inRange(hsv, [h_min, s_min, v_min], [h_max, 255, 255]) check"""
+    cells = np.zeros(_LEAF_HIST_SHAPE, dtype=bool)
+    s_bin = np.searchsorted(_LEAF_S_EDGES, s_min, side='right')
+    v_bin = np.searchsorted(_LEAF_V_EDGES, v_min, side='right')
+    cells[h_min:min(h_max, 179) + 1, s_bin:, v_bin:] = True
+    return cells
+
+# Human skin tones
+_SKIN_CELLS = _hsv_range(0, 20, 20, 70)
+# Clothing colors (e.g., blue for jeans, red for shirts)
+_BLUE_CELLS = _hsv_range(90, 130, 50, 50)
+_RED_CELLS = _hsv_range(0, 10, 70, 50) | _hsv_range(170, 180, 70, 50)
+# Fruit-like colors: red, orange, yellow and purple
+_FRUIT_CELLS = (_RED_CELLS | _hsv_range(10, 30, 70, 50) | _hsv_range(25, 35, 50, 50)
+                | _hsv_range(130, 160, 30, 30))
+# Grape leaf detection (based on green color)
+_GREEN_CELLS = _hsv_range(25, 95, 30, 30)
+
+def leaf_color_fractions(img, channel_order='BGR'):
+    """
+    Fraction of skin/blue/red/fruit/green pixels in a BGR (or RGB) image, from
+    a single hue/saturation/value histogram of a downsampled copy.
+    """
+    height, width = img.shape[:2]
+    scale = LEAF_CHECK_MAX_EDGE / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_NEAREST)
+
+    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV if channel_order == 'RGB' else cv2.COLOR_BGR2HSV)
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    index = (h.astype(np.intp) * _LEAF_HIST_SHAPE[1] + _LEAF_S_BIN[s]) * _LEAF_HIST_SHAPE[2] + _LEAF_V_BIN[v]
+    hist = np.bincount(index.ravel(), minlength=int(np.prod(_LEAF_HIST_SHAPE))).reshape(_LEAF_HIST_SHAPE)
+    total = float(h.size)
+
+    return {
+        'skin': hist[_SKIN_CELLS].sum() / total,
+        'blue': hist[_BLUE_CELLS].sum() / total,
+        'red': hist[_RED_CELLS].sum() / total,
+        'fruit': hist[_FRUIT_CELLS].sum() / total,
+        'green': hist[_GREEN_CELLS].sum() / total
+    }
+
+def is_grape_leaf_image(image):
     """
     Check if the image is a grape leaf and not a human, clothing, or fruit.
+    Accepts a file path or an RGB array from decode_image_bytes().
     Returns: (is_leaf, message)
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        return False, "Could not read image file"
-    
-    # Convert to HSV for color analysis
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    
-    # Define color ranges for unsupported objects
-    # Human skin tones
-    lower_skin = np.array([0, 20, 70], dtype=np.uint8)
-    upper_skin = np.array([20, 255, 255], dtype=np.uint8)
-    skin_mask = cv2.inRange(hsv, lower_skin, upper_skin)
-    skin_percentage = np.sum(skin_mask > 0) / (skin_mask.shape[0] * skin_mask.shape[1])
-    
-    # Clothing colors (e.g., blue for jeans, red for shirts)
-    lower_blue = np.array([90, 50, 50], dtype=np.uint8)
-    upper_blue = np.array([130, 255, 255], dtype=np.uint8)
-    blue_mask = cv2.inRange(hsv, lower_blue, upper_blue)
-    blue_percentage = np.sum(blue_mask > 0) / (blue_mask.shape[0] * blue_mask.shape[1])
-    
-    lower_red1 = np.array([0, 70, 50], dtype=np.uint8)
-    upper_red1 = np.array([10, 255, 255], dtype=np.uint8)
-    lower_red2 = np.array([170, 70, 50], dtype=np.uint8)
-    upper_red2 = np.array([180, 255, 255], dtype=np.uint8)
-    red_mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
-    red_mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-    red_mask = cv2.bitwise_or(red_mask1, red_mask2)
-    red_percentage = np.sum(red_mask > 0) / (red_mask.shape[0] * red_mask.shape[1])
-    
-    # Fruit-like structures (based on color and shape)
-    fruit_color_ranges = [
-        (np.array([0, 70, 50]), np.array([10, 255, 255])),  # Red
-        (np.array([170, 70, 50]), np.array([180, 255, 255])),  # Red (wrapped)
-        (np.array([10, 70, 50]), np.array([30, 255, 255])),  # Orange
-        (np.array([25, 50, 50]), np.array([35, 255, 255])),  # Yellow
-        (np.array([130, 30, 30]), np.array([160, 255, 255]))  # Purple
-    ]
-    combined_fruit_mask = np.zeros((img.shape[0], img.shape[1]), dtype=np.uint8)
-    for lower, upper in fruit_color_ranges:
-        color_mask = cv2.inRange(hsv, lower, upper)
-        combined_fruit_mask = cv2.bitwise_or(combined_fruit_mask, color_mask)
-    fruit_color_percentage = np.sum(combined_fruit_mask > 0) / (combined_fruit_mask.shape[0] * combined_fruit_mask.shape[1])
-    
-    # Grape leaf detection (based on green color)
-    lower_green = np.array([25, 30, 30], dtype=np.uint8)
-    upper_green = np.array([95, 255, 255], dtype=np.uint8)
-    green_mask = cv2.inRange(hsv, lower_green, upper_green)
-    green_percentage = np.sum(green_mask > 0) / (green_mask.shape[0] * green_mask.shape[1])
+    if isinstance(image, np.ndarray):
+        fractions = leaf_color_fractions(image, channel_order='RGB')
+    else:
+        img = cv2.imread(image) if image is not None else None
+        if img is None:
+            return False, "Could not read image file"
+        fractions = leaf_color_fractions(img)
     
     # Check for unsupported objects
-    if skin_percentage > 0.15:  # Significant skin tone detected
+    if fractions['skin'] > 0.15:  # Significant skin tone detected
         return False, "Unsupported image: Human detected"
-    if blue_percentage > 0.25 or red_percentage > 0.25:  # Significant clothing colors detected
+    if fractions['blue'] > 0.25 or fractions['red'] > 0.25:  # Significant clothing colors detected
         return False, "Unsupported image: Clothing detected"
-    if fruit_color_percentage > 0.4:  # Significant fruit-like colors detected
+    if fractions['fruit'] > 0.4:  # Significant fruit-like colors detected
         return False, "Unsupported image: Fruit detected"
     
     # Check for grape leaf
-    if green_percentage > 0.15:  # At least 15% green pixels
+    if fractions['green'] > 0.15:  # At least 15% green pixels
         return True, "Grape leaf detected"
     else:
         return False, "Unsupported image: Not a grape leaf"
@@ -394,10 +582,56 @@ from pathlib import Path
 # Set up Gemini API
 GEMINI_API_KEY1 = os.getenv('GEMINI_API_KEY')
 genai.configure(api_key=GEMINI_API_KEY1)
-gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+# Prompt templates for the variety texts; changing one (or the model) invalidates its cached texts
+GRAPE_DESCRIPTION_PROMPT = """Provide a detailed description of the grape variety '{variety_name}' for wine production. 
+        Include information about its origin, flavor profile, growing conditions, and common wine styles.
+        Keep the description to 2-3 sentences, focusing on the most important characteristics."""
+GROWING_RECOMMENDATIONS_PROMPT = """Provide specific growing recommendations for the grape variety '{variety_name}' for vineyard management.
+        Include key information about soil preferences, climate needs, pruning techniques, and disease management.
+        Keep the recommendations to 2-3 sentences, focusing on the most practical advice."""
+
+# Served when Gemini fails and nothing is cached for the variety
+FALLBACK_DESCRIPTIONS = {
+    "Cabernet Sauvignon": "A robust red grape variety known for its deep color, full body, and structured tannins. Thrives in moderate to warm climates.",
+    "Chardonnay": "A versatile white grape that produces wines ranging from crisp and mineral-driven to rich and buttery. Adaptable to various climates.",
+    "Pinot Noir": "A delicate red variety that produces elegant wines with red fruit flavors. Prefers cooler climates with moderate sunlight.",
+    "Bangalore Blue": "A South Indian variety of Concord grapes, known for its sweet, musky flavor. Well-adapted to tropical conditions."
+}
+FALLBACK_RECOMMENDATIONS = {
+    "Cabernet Sauvignon": "Plant in well-draining soils with full sun exposure. Requires regular pruning to control vigor and yield. Water moderately and apply balanced fertilization.",
+    "Chardonnay": "Plant in limestone-rich soils when possible. Moderate water needs with good drainage. Manage canopy to control sun exposure based on desired wine style.",
+    "Pinot Noir": "Requires careful site selection with good drainage and moderate temperatures. Sensitive to wind and frost; consider protection if needed. Careful canopy management is essential.",
+    "Bangalore Blue": "Grows well in tropical and subtropical climates. Plant in well-draining loamy soil with regular water during growing season. Trellising helps with air circulation and managing the vigorous growth."
+}
+
+DEFAULT_DESCRIPTION = "A grape variety used in wine production."
+DEFAULT_RECOMMENDATIONS = "Plant in suitable soil with proper drainage and appropriate climate conditions for this variety."
+
+# Gemini variety descriptions and recommendations, per worker or shared (MongoDB, disk)
+variety_text_cache = TextCache(
+    collection=db.variety_texts if LLM_CACHE_BACKEND == 'mongo' else None,
+    directory=LLM_CACHE_DIR if LLM_CACHE_BACKEND == 'disk' else None
+)
+
+def generate_variety_text(template, variety_name):
+    """One Gemini call for a variety prompt; raises when the API fails"""
+    response = gemini_model.generate_content(template.format(variety_name=variety_name))
+    return response.text.strip()
 
 # Define model variable globally
 model1 = None
+# model1 with a NumPy feature encoder: prediction and probabilities in one pass
+variety_model = None
+
+def compile_variety_model():
+    """Wrap model1 in the NumPy fast path and check it against the pipeline"""
+    global variety_model
+    variety_model = CompiledVarietyModel(model1)
+    variety_model.verify()
+    print(f"Variety model fast path {'enabled' if variety_model.compiled else 'disabled'}")
 
 # Load the trained model with enhanced error handling
 def load_grape_model():
@@ -424,6 +658,7 @@ def load_grape_model():
             with open(model_path, 'rb') as file:
                 model1 = pickle.load(file)
             print(f"Successfully loaded model using pickle from: {model_path}")
+            compile_variety_model()
             return True
         except Exception as pickle_error:
             print(f"Error loading with pickle: {str(pickle_error)}")
@@ -431,6 +666,7 @@ def load_grape_model():
                 # Try joblib as an alternative
                 model1 = joblib.load(model_path)
                 print(f"Successfully loaded model using joblib from: {model_path}")
+                compile_variety_model()
                 return True
             except Exception as joblib_error:
                 print(f"Error loading with joblib: {str(joblib_error)}")
@@ -455,48 +691,102 @@ def grapetyperec():
     global model1
     if model1 is None:
         # Try loading again when page is accessed
-        load_grape_model()
+        if load_grape_model():
+            prewarm_variety_texts()
     return render_template('grapetyperec.html')
 
 def get_grape_description(variety_name):
-    """Use Gemini API to get a detailed description of a grape variety."""
+    """Use Gemini API to get a detailed description of a grape variety (cached, see llm_cache.py)."""
     try:
-        prompt = f"""Provide a detailed description of the grape variety '{variety_name}' for wine production. 
-        Include information about its origin, flavor profile, growing conditions, and common wine styles.
-        Keep the description to 2-3 sentences, focusing on the most important characteristics."""
-        
-        response = gemini_model.generate_content(prompt)
-        return response.text.strip()
+        return variety_text_cache.get_or_generate(
+            variety_name, GRAPE_DESCRIPTION_PROMPT, GEMINI_MODEL_NAME,
+            lambda: generate_variety_text(GRAPE_DESCRIPTION_PROMPT, variety_name)
+        )
     except Exception as e:
         print(f"Error getting description from Gemini API: {str(e)}")
         # Fallback to basic descriptions if API fails
-        fallback_descriptions = {
-            "Cabernet Sauvignon": "A robust red grape variety known for its deep color, full body, and structured tannins. Thrives in moderate to warm climates.",
-            "Chardonnay": "A versatile white grape that produces wines ranging from crisp and mineral-driven to rich and buttery. Adaptable to various climates.",
-            "Pinot Noir": "A delicate red variety that produces elegant wines with red fruit flavors. Prefers cooler climates with moderate sunlight.",
-            "Bangalore Blue": "A South Indian variety of Concord grapes, known for its sweet, musky flavor. Well-adapted to tropical conditions."
-        }
-        return fallback_descriptions.get(variety_name, "A grape variety used in wine production.")
+        return FALLBACK_DESCRIPTIONS.get(variety_name, DEFAULT_DESCRIPTION)
 
 def get_growing_recommendations(variety_name):
-    """Use Gemini API to get growing recommendations for a grape variety."""
+    """Use Gemini API to get growing recommendations for a grape variety (cached, see llm_cache.py)."""
     try:
-        prompt = f"""Provide specific growing recommendations for the grape variety '{variety_name}' for vineyard management.
-        Include key information about soil preferences, climate needs, pruning techniques, and disease management.
-        Keep the recommendations to 2-3 sentences, focusing on the most practical advice."""
-        
-        response = gemini_model.generate_content(prompt)
-        return response.text.strip()
+        return variety_text_cache.get_or_generate(
+            variety_name, GROWING_RECOMMENDATIONS_PROMPT, GEMINI_MODEL_NAME,
+            lambda: generate_variety_text(GROWING_RECOMMENDATIONS_PROMPT, variety_name)
+        )
     except Exception as e:
         print(f"Error getting recommendations from Gemini API: {str(e)}")
         # Fallback to basic recommendations if API fails
-        fallback_recommendations = {
-            "Cabernet Sauvignon": "Plant in well-draining soils with full sun exposure. Requires regular pruning to control vigor and yield. Water moderately and apply balanced fertilization.",
-            "Chardonnay": "Plant in limestone-rich soils when possible. Moderate water needs with good drainage. Manage canopy to control sun exposure based on desired wine style.",
-            "Pinot Noir": "Requires careful site selection with good drainage and moderate temperatures. Sensitive to wind and frost; consider protection if needed. Careful canopy management is essential.",
-            "Bangalore Blue": "Grows well in tropical and subtropical climates. Plant in well-draining loamy soil with regular water during growing season. Trellising helps with air circulation and managing the vigorous growth."
-        }
-        return fallback_recommendations.get(variety_name, "Plant in suitable soil with proper drainage and appropriate climate conditions for this variety.")
+        return FALLBACK_RECOMMENDATIONS.get(variety_name, DEFAULT_RECOMMENDATIONS)
+
+# Per-request LLM enrichments run side by side, bounded by LLM_ENRICHMENT_DEADLINE seconds.
+# /predictgrp/describe has its own smaller pool so bulk lookups never queue ahead of /predictgrp
+LLM_ENRICHMENT_DEADLINE = float(os.getenv('LLM_ENRICHMENT_DEADLINE', '8'))
+enrichment_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('LLM_ENRICHMENT_WORKERS', '8')), thread_name_prefix='llm-enrichment'
+)
+describe_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('LLM_DESCRIBE_WORKERS', '4')), thread_name_prefix='llm-describe'
+)
+
+def fetch_variety_texts(varieties, deadline=LLM_ENRICHMENT_DEADLINE, pool=None):
+    """
+    Description and recommendations for each variety, with every Gemini call in flight at once.
+    Calls not finished at the deadline are answered from the fallback texts. Those not started
+    yet are cancelled; those already running finish in the background and fill the cache.
+    """
+    pool = pool or enrichment_pool
+    fields = {
+        'description': (get_grape_description, FALLBACK_DESCRIPTIONS, DEFAULT_DESCRIPTION),
+        'recommendations': (get_growing_recommendations, FALLBACK_RECOMMENDATIONS, DEFAULT_RECOMMENDATIONS)
+    }
+    futures = {
+        (variety, field): pool.submit(fetch, variety)
+        for variety in varieties
+        for field, (fetch, _, _) in fields.items()
+    }
+    wait(futures.values(), timeout=deadline)
+    
+    texts = {variety: {} for variety in varieties}
+    for (variety, field), future in futures.items():
+        if future.done() and not future.cancelled():
+            texts[variety][field] = future.result()
+        else:
+            future.cancel()
+            _, fallbacks, default = fields[field]
+            print(f"Gemini {field} for '{variety}' missed the {deadline:g}s deadline, using the fallback")
+            texts[variety][field] = fallbacks.get(variety, default)
+    return texts
+
+def prewarm_variety_texts():
+    """Generate missing or stale descriptions and recommendations for every variety model1 can predict"""
+    if model1 is None:
+        return
+    for variety in model1.classes_:
+        for template in (GRAPE_DESCRIPTION_PROMPT, GROWING_RECOMMENDATIONS_PROMPT):
+            variety_text_cache.prewarm(
+                str(variety), template, GEMINI_MODEL_NAME,
+                lambda template=template, variety=str(variety): generate_variety_text(template, variety)
+            )
+
+def build_variety_input(weather_data, soil_data):
+    """Map the weather/soil request fields onto the variety model's training columns"""
+    return {
+        "Temperature (°C)": weather_data['temp'],
+        "Min Temperature (°C)": weather_data['temp_min'],
+        "Max Temperature (°C)": weather_data['temp_max'],
+        "Humidity (%)": weather_data['humidity'],
+        "Pressure (hPa)": weather_data['pressure'],
+        "Weather Condition": weather_data['condition'],
+        "Wind Speed (m/s)": weather_data['wind_speed'],
+        "Wind Direction (°)": weather_data['wind_deg'],
+        "Soil pH": soil_data['ph'],
+        "Soil Moisture (%)": soil_data['moisture'],
+        "N (Nitrogen)": soil_data['nitrogen'],
+        "P (Phosphorus)": soil_data['phosphorus'],
+        "K (Potassium)": soil_data['potassium'],
+        "Type of Soil": soil_data['type']
+    }
 
 @app.route('/predictgrp', methods=['POST'])
 def predictgrp():
@@ -523,28 +813,14 @@ def predictgrp():
                 'success': False,
                 'message': "The grape variety prediction model could not be loaded. This may be due to scikit-learn version mismatch. Please upgrade scikit-learn to version 1.6.1 or higher using: pip install scikit-learn==1.6.1"
             })
+        prewarm_variety_texts()
     
     # Extract data from request
     weather_data = data['weather']
     soil_data = data['soil']
     
-    # Create a DataFrame with the input data
-    input_data = {
-        "Temperature (°C)": weather_data['temp'],
-        "Min Temperature (°C)": weather_data['temp_min'],
-        "Max Temperature (°C)": weather_data['temp_max'],
-        "Humidity (%)": weather_data['humidity'],
-        "Pressure (hPa)": weather_data['pressure'],
-        "Weather Condition": weather_data['condition'],
-        "Wind Speed (m/s)": weather_data['wind_speed'],
-        "Wind Direction (°)": weather_data['wind_deg'],
-        "Soil pH": soil_data['ph'],
-        "Soil Moisture (%)": soil_data['moisture'],
-        "N (Nitrogen)": soil_data['nitrogen'],
-        "P (Phosphorus)": soil_data['phosphorus'],
-        "K (Potassium)": soil_data['potassium'],
-        "Type of Soil": soil_data['type']
-    }
+    # Collect the input data under the model's training column names
+    input_data = build_variety_input(weather_data, soil_data)
     
     print(f"\nInput Data for Model:")
     print(f"Temperature: {input_data['Temperature (°C)']}°C")
@@ -562,37 +838,27 @@ def predictgrp():
             'message': is_valid['message']
         })
     
-    # Create DataFrame from input_data
-    df = pd.DataFrame([input_data])
-    
-    # Make prediction
+    # Make prediction (variety and probabilities from a single pass, no DataFrame)
     try:
         print("\n🔮 Making prediction...")
-        prediction = model1.predict(df)
-        predicted_variety = prediction[0]
+        labels, probabilities = variety_model.predict_with_proba([input_data])
+        predicted_variety = labels[0]
         
         print(f"✅ Predicted Variety: {predicted_variety}")
         
-        # Log prediction probabilities if available
-        if hasattr(model1, 'predict_proba'):
-            try:
-                probabilities = model1.predict_proba(df)
-                if hasattr(model1, 'classes_'):
-                    print(f"\nPrediction Probabilities:")
-                    for variety, prob in zip(model1.classes_, probabilities[0]):
-                        print(f"  {variety}: {prob*100:.2f}%")
-            except Exception as prob_error:
-                print(f"Could not get probabilities: {str(prob_error)}")
-        
-        # Get description and recommendations from Gemini API
-        description = get_grape_description(predicted_variety)
-        recommendations = get_growing_recommendations(predicted_variety)
+        # Log prediction probabilities
+        print(f"\nPrediction Probabilities:")
+        for variety, prob in zip(variety_model.classes_, probabilities[0]):
+            print(f"  {variety}: {prob*100:.2f}%")
+        
+        # Get description and recommendations from Gemini API (both calls at once)
+        texts = fetch_variety_texts([predicted_variety])[predicted_variety]
         
         return jsonify({
             'success': True,
             'variety': predicted_variety,
-            'description': description,
-            'recommendations': recommendations
+            'description': texts['description'],
+            'recommendations': texts['recommendations']
         })
     except Exception as e:
         error_details = traceback.format_exc()
@@ -620,7 +886,7 @@ def get_weatherforg():
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={API_KEY1}&units=metric"
     
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         weather_data = response.json()
         
         if response.status_code == 200:
@@ -648,51 +914,234 @@ def get_weatherforg():
             'message': f"Error fetching weather data: {str(e)}"
         })
 
+# Define acceptable ranges for grape cultivation
+VALID_RANGES = {
+    "Temperature (°C)": (10, 38),
+    "Humidity (%)": (6, 45),  # Updated for air humidity (not soil)
+    "Soil pH": (4.5, 8.5),
+    "Soil Moisture (%)": (10, 60),
+    "N (Nitrogen)": (50, 300),
+    "P (Phosphorus)": (10, 150),
+    "K (Potassium)": (50, 250)
+}
+VALID_SOIL_TYPES = ["Sandy", "Clayey", "Loamy", "Laterite", "Black"]
+UNSUITABLE_CONDITIONS = ["Thunderstorm", "Snow", "Tornado", "Hurricane", "Blizzard"]
+
 def validate_parameters(data):
     """Validate if the climate and soil parameters are suitable for grape cultivation"""
+    message = validate_parameters_bulk([data])[0]
+    if message is not None:
+        return {'valid': False, 'message': message}
+    return {'valid': True}
+
+def validate_parameters_bulk(rows):
+    """
+    validate_parameters for many rows at once: one array comparison per check.
+    Returns the first failure message of each row, or None for rows that are valid.
+    """
+    messages = [None] * len(rows)
     
-    # Define acceptable ranges for grape cultivation
-    valid_ranges = {
-        "Temperature (°C)": (10, 38),
-        "Humidity (%)": (6, 45),  # Updated for air humidity (not soil)
-        "Soil pH": (4.5, 8.5),
-        "Soil Moisture (%)": (10, 60),
-        "N (Nitrogen)": (50, 300),
-        "P (Phosphorus)": (10, 150),
-        "K (Potassium)": (50, 250)
-    }
+    def fail(mask, message_for):
+        for i in np.flatnonzero(mask):
+            if messages[i] is None:
+                messages[i] = message_for(rows[i])
     
     # Check each parameter
-    for param, (min_val, max_val) in valid_ranges.items():
-        if data[param] < min_val or data[param] > max_val:
-            return {
-                'valid': False,
-                'message': f"Invalid {param}: Value {data[param]} is outside the acceptable range ({min_val} - {max_val}) for grape cultivation."
-            }
+    for param, (min_val, max_val) in VALID_RANGES.items():
+        values = np.array([row[param] for row in rows], dtype=np.float64)
+        fail(
+            (values < min_val) | (values > max_val),
+            lambda row: f"Invalid {param}: Value {row[param]} is outside the acceptable range ({min_val} - {max_val}) for grape cultivation."
+        )
     
     # Check soil type
-    valid_soil_types = ["Sandy", "Clayey", "Loamy", "Laterite", "Black"]
-    if data["Type of Soil"] not in valid_soil_types:
-        return {
-            'valid': False,
-            'message': f"Invalid soil type: {data['Type of Soil']}. Must be one of {', '.join(valid_soil_types)}."
-        }
+    soil_types = np.array([row["Type of Soil"] for row in rows], dtype=object)
+    fail(
+        ~np.isin(soil_types, VALID_SOIL_TYPES),
+        lambda row: f"Invalid soil type: {row['Type of Soil']}. Must be one of {', '.join(VALID_SOIL_TYPES)}."
+    )
     
     # Check weather condition
-    unsuitable_conditions = ["Thunderstorm", "Snow", "Tornado", "Hurricane", "Blizzard"]
-    if data["Weather Condition"] in unsuitable_conditions:
-        return {
-            'valid': False,
-            'message': f"Unsuitable weather condition: {data['Weather Condition']} is not appropriate for grape cultivation."
-        }
+    conditions = np.array([row["Weather Condition"] for row in rows], dtype=object)
+    fail(
+        np.isin(conditions, UNSUITABLE_CONDITIONS),
+        lambda row: f"Unsuitable weather condition: {row['Weather Condition']} is not appropriate for grape cultivation."
+    )
     
-    return {'valid': True}
-
-
-
-
+    return messages
 
+# Sites scored per model call in /predictgrp/sweep, and the most sites one request may ask for
+SWEEP_CHUNK = int(os.getenv('SWEEP_CHUNK', '4096'))
+SWEEP_MAX_SITES = int(os.getenv('SWEEP_MAX_SITES', '50000'))
+# Variety model columns holding category names; every other column is numeric
+VARIETY_CATEGORICAL_FEATURES = ("Weather Condition", "Type of Soil")
 
+def check_variety_row(row, categories):
+    """
+    Convert the numeric fields of a build_variety_input row to floats (in place) and check
+    the categorical ones against the categories the model was trained on.
+    Returns the first problem as a message, or None when the model can score the row.
+    """
+    for name, value in row.items():
+        if name in VARIETY_CATEGORICAL_FEATURES:
+            known = categories.get(name)
+            try:
+                unknown = known is not None and value not in known
+            except TypeError:
+                unknown = True
+            if unknown:
+                return f"Invalid {name}: {value} is not one of the values the model was trained on."
+            continue
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            row[name] = float(value)
+        except (TypeError, ValueError):
+            return f"Invalid {name}: {value!r} is not a number."
+        if not np.isfinite(row[name]):
+            return f"Invalid {name}: {value!r} is not a number."
+    return None
+
+def expand_site_grid(grid):
+    """
+    Cartesian product of a site grid: {"base": {"weather": {...}, "soil": {...}},
+    "vary": {"weather": {"temp": [...]}, "soil": {"ph": [...]}}} -> list of sites
+    """
+    base = grid.get('base', {})
+    axes = [
+        (group, field, values)
+        for group in ('weather', 'soil')
+        for field, values in grid.get('vary', {}).get(group, {}).items()
+    ]
+    size = int(np.prod([len(values) for _, _, values in axes])) if axes else 1
+    if size > SWEEP_MAX_SITES:
+        raise ValueError(f"Grid has {size} sites, the limit is {SWEEP_MAX_SITES}")
+    
+    sites = []
+    for combination in itertools.product(*[values for _, _, values in axes]):
+        site = {'weather': dict(base.get('weather', {})), 'soil': dict(base.get('soil', {}))}
+        for (group, field, _), value in zip(axes, combination):
+            site[group][field] = value
+        sites.append(site)
+    return sites
+
+@app.route('/predictgrp/sweep', methods=['POST'])
+def predictgrp_sweep():
+    """
+    Rank grape varieties for many sites at once.
+    Accepts {"sites": [{"site_id": ..., "weather": {...}, "soil": {...}}, ...]} (same fields as /predictgrp)
+    or {"grid": {...}} (see expand_site_grid). Streams one NDJSON line per site with the top
+    varieties and their probabilities, then a summary line. Descriptions come from /predictgrp/describe.
+    """
+    if model1 is None and not load_grape_model():
+        return jsonify({'success': False, 'message': "The grape variety prediction model could not be loaded."}), 503
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        sites = expand_site_grid(data['grid']) if 'grid' in data else data.get('sites') or []
+        top = max(1, int(request.args.get('top', data.get('top', 3))))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'success': False, 'message': f"Invalid request: {str(e)}"}), 400
+    if not sites:
+        return jsonify({'success': False, 'message': "No sites provided"}), 400
+    if not isinstance(sites, list):
+        return jsonify({'success': False, 'message': "'sites' must be a list"}), 400
+    if len(sites) > SWEEP_MAX_SITES:
+        return jsonify({'success': False, 'message': f"Too many sites ({len(sites)}), the limit is {SWEEP_MAX_SITES}"}), 400
+    
+    # Map every site onto the model's columns; sites with missing, non-numeric or unknown
+    # fields are reported, not scored
+    categories = {name: set(values.tolist()) for name, values in variety_model.categories.items()}
+    rows, positions, results = [], [], [None] * len(sites)
+    for position, site in enumerate(sites):
+        if not isinstance(site, dict):
+            results[position] = {'site_id': position, 'valid': False, 'message': "Site must be an object with weather and soil"}
+            continue
+        site_id = site.get('site_id', position)
+        try:
+            row = build_variety_input(site['weather'], site['soil'])
+        except (KeyError, TypeError) as e:
+            results[position] = {'site_id': site_id, 'valid': False, 'message': f"Missing field: {str(e)}"}
+            continue
+        message = check_variety_row(row, categories)
+        if message is not None:
+            results[position] = {'site_id': site_id, 'valid': False, 'message': message}
+            continue
+        rows.append(row)
+        positions.append(position)
+    
+    try:
+        messages = validate_parameters_bulk(rows)
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': f"Invalid site parameters: {str(e)}"}), 400
+    
+    valid_rows = [row for row, message in zip(rows, messages) if message is None]
+    valid_positions = [p for p, message in zip(positions, messages) if message is None]
+    for position, message in zip(positions, messages):
+        if message is not None:
+            results[position] = {'site_id': sites[position].get('site_id', position), 'valid': False, 'message': message}
+    
+    def generate():
+        scored = 0
+        classes = variety_model.classes_
+        emitted = 0
+        for start in range(0, len(valid_rows), SWEEP_CHUNK):
+            try:
+                _, probabilities = variety_model.predict_with_proba(valid_rows[start:start + SWEEP_CHUNK])
+            except Exception as e:
+                # Headers are already sent; report the failure in-band and stop
+                yield json.dumps({'error': str(e)}) + '\n'
+                return
+            ranking = np.argsort(-probabilities, axis=1)[:, :top]
+            for position, order, row_probabilities in zip(valid_positions[start:start + SWEEP_CHUNK], ranking, probabilities):
+                results[position] = {
+                    'site_id': sites[position].get('site_id', position),
+                    'valid': True,
+                    'varieties': [
+                        {'variety': str(classes[i]), 'probability': float(row_probabilities[i])}
+                        for i in order
+                    ]
+                }
+            scored += len(ranking)
+            
+            # Emit every finished site in request order
+            lines = []
+            while emitted < len(results) and results[emitted] is not None:
+                lines.append(json.dumps(results[emitted]) + '\n')
+                emitted += 1
+            yield ''.join(lines)
+        
+        yield ''.join(json.dumps(result) + '\n' for result in results[emitted:])
+        yield json.dumps({'sites': len(sites), 'scored': scored, 'invalid': len(sites) - scored, 'done': True}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/predictgrp/describe', methods=['POST'])
+def predictgrp_describe():
+    """Optional follow-up to /predictgrp/sweep: Gemini descriptions and growing advice for chosen varieties"""
+    if model1 is None and not load_grape_model():
+        return jsonify({'success': False, 'message': "The grape variety prediction model could not be loaded."}), 503
+    
+    data = request.get_json(silent=True) or {}
+    varieties = data.get('varieties') if isinstance(data, dict) else None
+    if not isinstance(varieties, list) or not all(isinstance(v, str) for v in varieties):
+        return jsonify({'success': False, 'message': "'varieties' must be a list of variety names"}), 400
+    varieties = list(dict.fromkeys(varieties))
+    if not varieties:
+        return jsonify({'success': False, 'message': "No varieties provided"}), 400
+    
+    # Only varieties the model can predict: each name costs two Gemini calls and two cache entries
+    known = {str(variety) for variety in model1.classes_}
+    if len(varieties) > len(known):
+        return jsonify({'success': False, 'message': f"At most {len(known)} varieties per request"}), 400
+    unknown = [variety for variety in varieties if variety not in known]
+    if unknown:
+        return jsonify({'success': False, 'message': f"Unknown varieties: {', '.join(unknown)}"}), 400
+    
+    return jsonify({
+        'success': True,
+        'varieties': fetch_variety_texts(varieties, pool=describe_pool)
+    })
 
 
 # Configuration
@@ -700,6 +1149,77 @@ def validate_parameters(data):
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 
+GROQ_MODEL = "llama-3.3-70b-versatile"  # Using Llama 3.3 model for better responses
+
+# System prompt to restrict chatbot to agriculture topics only
+GROQ_SYSTEM_PROMPT = """You are an expert agricultural advisor specializing in crop cultivation, plant diseases, pest management, soil health, irrigation, fertilizers, and farming techniques. 
+
+Your expertise includes:
+- Crop diseases and their treatments
+- Pest identification and management
+- Soil testing and nutrient management
+- Irrigation systems and water management
+- Organic and sustainable farming practices
+- Grape cultivation and viticulture
+- Apple cultivation and orchard management
+- Fertilizer recommendations
+- Weather-based farming advice
+- Harvesting and post-harvest management
+
+IMPORTANT RULES:
+1. ONLY answer questions related to agriculture, farming, crops, plants, soil, irrigation, fertilizers, pesticides, and related agricultural topics.
+2. If the user asks about anything NOT related to agriculture (like general knowledge, entertainment, sports, technology not related to farming, etc.), politely respond with: "I apologize, but I don't have expertise in that area. I specialize in agricultural topics only. Please ask me questions related to farming, crop cultivation, plant diseases, soil management, irrigation, or other agricultural matters."
+3. Provide practical, actionable advice for farmers.
+4. Be concise but informative.
+5. Use simple language that farmers can understand.
+
+Always stay within your agricultural expertise domain."""
+
+def groq_headers():
+    return {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+def groq_payload(message, stream=False):
+    """Chat completion request for one farmer question"""
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": GROQ_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": message
+            }
+        ],
+        "temperature": 0.7,
+        "max_tokens": 1024,
+        "top_p": 1,
+        "stream": stream
+    }
+
+# Repeated (or closely rephrased) chatbot questions are answered without calling Groq
+chat_cache = ChatCache()
+
+# How long streaming chats hold a worker thread, reported by /health
+chat_stream_lock = threading.Lock()
+chat_stream_totals = {'active': 0, 'completed': 0, 'failed': 0, 'first_token_seconds': 0.0, 'busy_seconds': 0.0}
+
+def chat_stream_stats():
+    with chat_stream_lock:
+        totals = dict(chat_stream_totals)
+    finished = totals['completed'] + totals['failed']
+    return {
+        'active': totals['active'],
+        'completed': totals['completed'],
+        'failed': totals['failed'],
+        'avg_first_token_seconds': round(totals['first_token_seconds'] / totals['completed'], 3) if totals['completed'] else None,
+        'avg_busy_seconds': round(totals['busy_seconds'] / finished, 3) if finished else None
+    }
+
 # Gemini API for image processing
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
@@ -722,7 +1242,17 @@ def index():
 @app.route('/health')
 def health():
     """Health check endpoint for Railway"""
-    return jsonify({"status": "healthy", "models_loaded": model is not None})
+    return jsonify({
+        "status": "healthy",
+        "models_loaded": model is not None,
+        "batching": grape_batcher.stats() if isinstance(grape_batcher, MicroBatcher) else None,
+        "inference_service": inference_client.stats() if inference_client is not None else None,
+        "risk_grid": risk_grid.stats() if risk_grid is not None else None,
+        "variety_text_cache": variety_text_cache.stats(),
+        "chat_cache": chat_cache.stats(),
+        "chat_streams": chat_stream_stats(),
+        "upstreams": http_client.stats()
+    })
 
 @app.route('/warmup')
 def warmup():
@@ -779,59 +1309,17 @@ def process_text_with_groq(message):
     Process text queries using Groq API with agriculture-focused responses
     """
     try:
-        # System prompt to restrict chatbot to agriculture topics only
-        system_prompt = """You are an expert agricultural advisor specializing in crop cultivation, plant diseases, pest management, soil health, irrigation, fertilizers, and farming techniques. 
-
-Your expertise includes:
-- Crop diseases and their treatments
-- Pest identification and management
-- Soil testing and nutrient management
-- Irrigation systems and water management
-- Organic and sustainable farming practices
-- Grape cultivation and viticulture
-- Apple cultivation and orchard management
-- Fertilizer recommendations
-- Weather-based farming advice
-- Harvesting and post-harvest management
-
-IMPORTANT RULES:
-1. ONLY answer questions related to agriculture, farming, crops, plants, soil, irrigation, fertilizers, pesticides, and related agricultural topics.
-2. If the user asks about anything NOT related to agriculture (like general knowledge, entertainment, sports, technology not related to farming, etc.), politely respond with: "I apologize, but I don't have expertise in that area. I specialize in agricultural topics only. Please ask me questions related to farming, crop cultivation, plant diseases, soil management, irrigation, or other agricultural matters."
-3. Provide practical, actionable advice for farmers.
-4. Be concise but informative.
-5. Use simple language that farmers can understand.
-
-Always stay within your agricultural expertise domain."""
-
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": "llama-3.3-70b-versatile",  # Using Llama 3.3 model for better responses
-            "messages": [
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": message
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 1024,
-            "top_p": 1,
-            "stream": False
-        }
-
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
+        cached = chat_cache.get(message)
+        if cached is not None:
+            return jsonify({"response": cached})
+        
+        response = http_client.post(GROQ_API_URL, headers=groq_headers(), json=groq_payload(message))
         
         if response.status_code == 200:
             response_data = response.json()
             try:
                 message_text = response_data['choices'][0]['message']['content']
+                chat_cache.set(message, message_text)
                 return jsonify({"response": message_text})
             except (KeyError, IndexError) as e:
                 return jsonify({
@@ -855,20 +1343,148 @@ Always stay within your agricultural expertise domain."""
             "details": str(e)
         }), 500
 
+def sse_event(data, event=None):
+    """One server-sent event carrying a JSON payload"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /api/chat for text questions, as server-sent events:
+    data: {"token": "..."} for each chunk Groq produces, then data: {"done": true}.
+    Failures arrive as an "error" event with the same fields /api/chat returns.
+    """
+    data = request.get_json(silent=True) or request.form
+    message = (data.get('message') or '').strip()
+    if not message:
+        return jsonify({"error": "Empty message"}), 400
+    
+    def events():
+        started = time.time()
+        first_token = None
+        completed = False
+        with chat_stream_lock:
+            chat_stream_totals['active'] += 1
+        try:
+            cached = chat_cache.get(message)
+            if cached is not None:
+                first_token = time.time()
+                yield sse_event({"token": cached})
+                yield sse_event({"done": True, "cached": True})
+                completed = True
+                return
+            
+            parts = []
+            with http_client.post(GROQ_API_URL, headers=groq_headers(), json=groq_payload(message, stream=True),
+                               stream=True, timeout=(10, 30)) as upstream:
+                if upstream.status_code != 200:
+                    yield sse_event({
+                        "error": "API Error",
+                        "details": f"Error {upstream.status_code}: {upstream.text}"
+                    }, event='error')
+                    return
+                # OpenAI-style stream: "data: {chunk}" lines ending with "data: [DONE]"
+                for line in upstream.iter_lines():
+                    line = line.decode('utf-8')
+                    if not line.startswith('data:'):
+                        continue
+                    chunk = line[len('data:'):].strip()
+                    if chunk == '[DONE]':
+                        break
+                    token = json.loads(chunk)['choices'][0]['delta'].get('content')
+                    if token:
+                        if first_token is None:
+                            first_token = time.time()
+                        parts.append(token)
+                        yield sse_event({"token": token})
+            
+            if parts:
+                chat_cache.set(message, ''.join(parts))
+            yield sse_event({"done": True})
+            completed = True
+        except requests.exceptions.Timeout:
+            yield sse_event({
+                "error": "Timeout Error",
+                "details": "The request took too long. Please try again."
+            }, event='error')
+        except Exception as e:
+            yield sse_event({"error": "Server Error", "details": str(e)}, event='error')
+        finally:
+            busy = time.time() - started
+            with chat_stream_lock:
+                chat_stream_totals['active'] -= 1
+                chat_stream_totals['busy_seconds'] += busy
+                if completed:
+                    chat_stream_totals['completed'] += 1
+                    chat_stream_totals['first_token_seconds'] += (first_token or time.time()) - started
+                else:
+                    chat_stream_totals['failed'] += 1
+            print(f"Chat stream {'completed' if completed else 'failed'}: first token "
+                  f"{(first_token - started) if first_token else float('nan'):.2f}s, worker busy {busy:.2f}s")
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Photos sent to Gemini vision are shrunk to VISION_MAX_EDGE pixels on the long side
+VISION_MAX_EDGE = int(os.getenv('VISION_MAX_EDGE', '1024'))
+VISION_JPEG_QUALITY = int(os.getenv('VISION_JPEG_QUALITY', '85'))
+# The analysed photo is served back from CHAT_IMAGE_FOLDER for CHAT_IMAGE_TTL seconds
+CHAT_IMAGE_TTL = int(os.getenv('CHAT_IMAGE_TTL', '900'))
+CHAT_IMAGE_FOLDER = os.path.join(UPLOAD_FOLDER, 'chat')
+os.makedirs(CHAT_IMAGE_FOLDER, exist_ok=True)
+
+def prepare_vision_image(image_bytes, max_edge=VISION_MAX_EDGE, quality=VISION_JPEG_QUALITY):
+    """Upright RGB JPEG of at most max_edge pixels per side, without EXIF or other metadata"""
+    img = Image.open(io.BytesIO(image_bytes))
+    # Apply the camera orientation before the EXIF block that records it is dropped
+    img = ImageOps.exif_transpose(img).convert('RGB')
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=quality, optimize=True)
+    return buffered.getvalue()
+
+def _remove_expired_chat_images():
+    now = time.time()
+    for name in os.listdir(CHAT_IMAGE_FOLDER):
+        path = os.path.join(CHAT_IMAGE_FOLDER, name)
+        try:
+            if now - os.path.getmtime(path) > CHAT_IMAGE_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+def store_chat_image(jpeg_bytes):
+    """Write the photo in the background for /chat-image and return its URL"""
+    name = f"{uuid.uuid4().hex}.jpg"
+    upload_writer.submit(_write_upload, os.path.join(CHAT_IMAGE_FOLDER, name), jpeg_bytes)
+    upload_writer.submit(_remove_expired_chat_images)
+    return url_for('chat_image', name=name)
+
+@app.route('/chat-image/<name>')
+def chat_image(name):
+    """Photos analysed by /api/chat, available for CHAT_IMAGE_TTL seconds"""
+    name = secure_filename(name)
+    path = os.path.join(CHAT_IMAGE_FOLDER, name)
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > CHAT_IMAGE_TTL:
+        return jsonify({'error': 'Image not found or expired'}), 404
+    return send_from_directory(CHAT_IMAGE_FOLDER, name, mimetype='image/jpeg', max_age=CHAT_IMAGE_TTL)
+
 def process_image_with_gemini(file, query):
     """
     Process image queries using Gemini API v1 (not v1beta) with vision capabilities
     Restricted to agriculture-related image analysis only
     """
     try:
-        # Read and process image
+        # Read the upload and shrink it before it is base64-encoded into the API request
         img_bytes = file.read()
-        img = Image.open(io.BytesIO(img_bytes))
-        
-        # Convert image to base64 for API request
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        jpeg_bytes = prepare_vision_image(img_bytes)
+        print(f"Vision image: {len(img_bytes) / 1024:.0f} KB upload -> {len(jpeg_bytes) / 1024:.0f} KB JPEG")
+        img_base64 = base64.b64encode(jpeg_bytes).decode('utf-8')
+        image_url = store_chat_image(jpeg_bytes)
         
         # Agriculture-focused prompt
         agriculture_context = """You are an expert agricultural image analyst. 
@@ -914,7 +1530,7 @@ IMPORTANT RULES:
         }
         
         # Make the API request
-        response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+        response = http_client.post(api_url, headers=headers, json=payload)
         response_json = response.json()
         
         # Extract the generated text
@@ -927,7 +1543,7 @@ IMPORTANT RULES:
 
         return jsonify({
             'response': generated_text,
-            'image': img_base64
+            'image_url': image_url
         })
     
     except requests.exceptions.Timeout:
@@ -949,6 +1565,74 @@ def grapeDis():
 def appleDis():
     return render_template('apple.html', diseases=class_names)
 
+def refine_leaf_predictions(images, preds):
+    """
+    Re-score low-confidence predictions with test-time augmentation (TTA_MODE=auto).
+    The views of every uncertain image run as one batch; returns (preds, tta info per row).
+    """
+    infos = [None] * len(preds)
+    if TTA_MODE != 'auto':
+        return preds, infos
+    
+    uncertain = [i for i, pred in enumerate(preds) if needs_tta(pred)]
+    if not uncertain:
+        return preds, infos
+    
+    preds = np.array(preds, dtype=np.float32)
+    refined = tta_predict(grape_batcher.predict, images[uncertain], preds[uncertain])
+    for i, pred in zip(uncertain, refined):
+        infos[i] = {
+            'views': len(TTA_VIEW_NAMES) + 1,
+            'first_pass_prediction': class_names[int(np.argmax(preds[i]))],
+            'first_pass_confidence': float(np.max(preds[i]))
+        }
+        preds[i] = pred
+    return preds, infos
+
+def build_leaf_result(pred, tta_info=None):
+    """Turn one softmax row from grape_model into the /predict response payload"""
+    predicted_class_index = int(np.argmax(pred))
+    predicted_disease = class_names[predicted_class_index]
+    confidence = float(pred[predicted_class_index])
+    
+    # Get disease information
+    disease_data = disease_info.get(predicted_disease, {})
+    symptoms = disease_data.get('symptoms', [])
+    pesticides = disease_data.get('pesticides', [])
+    prevention = disease_data.get('prevention', [])
+    
+    result = {
+        'prediction': predicted_disease,
+        'confidence': confidence,
+        'message': f'This grape leaf appears to have {predicted_disease} with {confidence:.2%} confidence.',
+        'is_leaf': True,
+        'disease_info': {
+            'symptoms': symptoms,
+            'pesticides': pesticides,
+            'prevention': prevention
+        }
+    }
+    if tta_info is not None:
+        result['tta'] = tta_info
+    return result
+
+def diagnose_leaf_image(image):
+    """Predict the disease of a decoded leaf image, answering repeats from the prediction cache"""
+    key = image_key(image, GRAPE_MODEL_ID)
+    result = prediction_cache.get(key)
+    cache_hit = result is not None
+    
+    if not cache_hit:
+        # Preprocess and predict
+        img = preprocess_image(image)
+        preds, tta_infos = refine_leaf_predictions(img, grape_batcher.predict(img))
+        result = build_leaf_result(preds[0], tta_infos[0])
+        prediction_cache.set(key, result)
+    
+    result = dict(result)
+    result['cache'] = dict(prediction_cache.stats(), hit=cache_hit)
+    return result
+
 @app.route('/predict', methods=['POST','GET'])
 def predict():
     # Lazy load models on first use
@@ -971,12 +1655,13 @@ def predict():
                 'is_leaf': False
             })
         
-        # Save the file
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(filepath)
+        # Decode the upload once, straight from the request stream
+        image_bytes = file.read()
+        image = decode_image_bytes(image_bytes)
+        save_upload_async(image_bytes, file.filename)
         
         # Check if it's a grape leaf
-        is_leaf, leaf_message = is_grape_leaf_image(filepath)
+        is_leaf, leaf_message = is_grape_leaf_image(image)
         
         if not is_leaf:
             result = {
@@ -987,39 +1672,187 @@ def predict():
             }
             return jsonify(result)
         
-        # Preprocess and predict
+        # Preprocess and predict (or reuse the cached result for this image)
         try:
-            img = preprocess_image(filepath)
-            pred = model.predict(img)[0]
-            predicted_class_index = np.argmax(pred)
-            predicted_disease = class_names[predicted_class_index]
-            confidence = float(pred[predicted_class_index])
-            
-            # Get disease information
-            disease_data = disease_info.get(predicted_disease, {})
-            symptoms = disease_data.get('symptoms', [])
-            pesticides = disease_data.get('pesticides', [])
-            prevention = disease_data.get('prevention', [])
-            
-            result = {
-                'prediction': predicted_disease,
-                'confidence': confidence,
-                'message': f'This grape leaf appears to have {predicted_disease} with {confidence:.2%} confidence.',
-                'is_leaf': True,
-                'disease_info': {
-                    'symptoms': symptoms,
-                    'pesticides': pesticides,
-                    'prevention': prevention
-                }
-            }
+            result = diagnose_leaf_image(image)
             return jsonify(result)
         
+        except InferenceServiceError as e:
+            # Inference service saturated or unreachable: tell the client to retry
+            return jsonify({
+                'error': str(e), 
+                'is_leaf': True
+            }), 503
+        
         except Exception as e:
             return jsonify({
                 'error': str(e), 
                 'is_leaf': True
             })
 
+# Images per forward pass in /predict/batch
+PREDICT_BATCH_CHUNK = int(os.getenv('PREDICT_BATCH_CHUNK', '32'))
+# Limits per /predict/batch request. They apply to uploaded parts as they are read and to
+# zip members by their uncompressed size, before extracting
+PREDICT_BATCH_MAX_IMAGE_BYTES = int(os.getenv('PREDICT_BATCH_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+PREDICT_BATCH_MAX_BYTES = int(os.getenv('PREDICT_BATCH_MAX_BYTES', str(512 * 1024 * 1024)))
+PREDICT_BATCH_MAX_IMAGES = int(os.getenv('PREDICT_BATCH_MAX_IMAGES', '2000'))
+
+def read_batch_uploads(files):
+    """
+    (filename, bytes) of every uploaded part, reading no part past its limit.
+    Raises ValueError when the parts exceed the per-file, total or count limits.
+    """
+    uploads = []
+    total = 0
+    for f in files:
+        if len(uploads) >= PREDICT_BATCH_MAX_IMAGES:
+            raise ValueError(f"At most {PREDICT_BATCH_MAX_IMAGES} files per request")
+        # An archive may take the whole request budget, a single image only its own limit
+        file_limit = PREDICT_BATCH_MAX_BYTES if f.filename.lower().endswith('.zip') else PREDICT_BATCH_MAX_IMAGE_BYTES
+        limit = min(file_limit, PREDICT_BATCH_MAX_BYTES - total)
+        data = f.read(limit + 1)
+        if len(data) > limit:
+            if limit == file_limit:
+                raise ValueError(f"{f.filename} is larger than {file_limit} bytes")
+            raise ValueError(f"Uploads are limited to {PREDICT_BATCH_MAX_BYTES} bytes per request")
+        total += len(data)
+        uploads.append((f.filename, data))
+    return uploads
+
+def iter_batch_uploads(uploads):
+    """Yield (filename, bytes, error) for every image in the uploaded files and zip archives"""
+    extracted_bytes = 0
+    extracted_images = 0
+    for filename, data in uploads:
+        if filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                    for info in archive.infolist():
+                        name = info.filename
+                        if info.is_dir() or name.startswith('__MACOSX/') or not allowed_file(name):
+                            continue
+                        if info.file_size > PREDICT_BATCH_MAX_IMAGE_BYTES:
+                            yield name, None, f'Image larger than {PREDICT_BATCH_MAX_IMAGE_BYTES} bytes'
+                            continue
+                        if (extracted_images >= PREDICT_BATCH_MAX_IMAGES
+                                or extracted_bytes + info.file_size > PREDICT_BATCH_MAX_BYTES):
+                            # The rest of this archive (and any later one) is not extracted
+                            yield filename, None, (
+                                f'Requests are limited to {PREDICT_BATCH_MAX_IMAGES} images and '
+                                f'{PREDICT_BATCH_MAX_BYTES} bytes of images; remaining images skipped'
+                            )
+                            break
+                        extracted_images += 1
+                        extracted_bytes += info.file_size
+                        yield name, archive.read(info), None
+            except zipfile.BadZipFile:
+                yield filename, None, 'Invalid zip archive'
+        elif allowed_file(filename):
+            extracted_images += 1
+            extracted_bytes += len(data)
+            yield filename, data, None
+        else:
+            yield filename, None, None
+
+def diagnose_leaf_chunk(chunk):
+    """Leaf-filter and predict a list of (filename, bytes, error) with one batched forward pass"""
+    results = [None] * len(chunk)
+    pending = []  # (position, cache key, preprocessed image)
+    
+    for position, (filename, image_bytes, error) in enumerate(chunk):
+        image = decode_image_bytes(image_bytes) if image_bytes is not None else None
+        if image is None:
+            results[position] = {
+                'filename': filename,
+                'error': error or 'File must be an image (PNG, JPG, JPEG)',
+                'is_leaf': False
+            }
+            continue
+        
+        is_leaf, leaf_message = is_grape_leaf_image(image)
+        if not is_leaf:
+            results[position] = {
+                'filename': filename,
+                'prediction': 'Unsupported',
+                'confidence': 0.0,
+                'message': leaf_message,
+                'is_leaf': False
+            }
+            continue
+        
+        key = image_key(image, GRAPE_MODEL_ID)
+        cached = prediction_cache.get(key)
+        if cached is not None:
+            results[position] = dict(cached, filename=filename, cached=True)
+        else:
+            pending.append((position, key, preprocess_image(image)))
+    
+    if pending:
+        # One forward pass for every leaf in the chunk that wasn't cached
+        batch = np.concatenate([img for _, _, img in pending], axis=0)
+        preds, tta_infos = refine_leaf_predictions(batch, grape_batcher.predict(batch))
+        for (position, key, _), pred, tta_info in zip(pending, preds, tta_infos):
+            result = build_leaf_result(pred, tta_info)
+            prediction_cache.set(key, result)
+            results[position] = dict(result, filename=chunk[position][0], cached=False)
+    
+    return results
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Diagnose many leaf photos in one request (multipart files and/or zip archives).
+    Results are streamed back as NDJSON, one line per image, followed by a summary line.
+    """
+    # Lazy load models on first use
+    load_models_if_needed()
+    
+    # Read the raw uploads now: the request's file handles are closed once the view returns,
+    # decoding and prediction still happen chunk by chunk while the response streams
+    try:
+        uploads = read_batch_uploads(
+            f for field in request.files for f in request.files.getlist(field) if f and f.filename
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
+    if not uploads:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    def generate():
+        counts = {'images': 0, 'leaves': 0, 'unsupported': 0, 'errors': 0}
+        chunk = []
+        
+        def flush():
+            try:
+                results = diagnose_leaf_chunk(chunk)
+            except Exception as e:
+                # The chunk never reached the leaf filter, so these images are errors, not leaves
+                results = [{'filename': name, 'error': str(e), 'is_leaf': None} for name, _, _ in chunk]
+            lines = []
+            for result in results:
+                counts['images'] += 1
+                if 'error' in result:
+                    counts['errors'] += 1
+                elif result['is_leaf']:
+                    counts['leaves'] += 1
+                else:
+                    counts['unsupported'] += 1
+                lines.append(json.dumps(result) + '\n')
+            chunk.clear()
+            return ''.join(lines)
+        
+        for upload in iter_batch_uploads(uploads):
+            chunk.append(upload)
+            if len(chunk) >= PREDICT_BATCH_CHUNK:
+                yield flush()
+        if chunk:
+            yield flush()
+        
+        yield json.dumps(dict(counts, done=True)) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/predictgrape', methods=['POST'])
 def predictgrape():
     """
@@ -1075,6 +1908,9 @@ def capture():
     """
     Handle image capture from the camera.
     """
+    # Lazy load models on first use
+    load_models_if_needed()
+    
     try:
         # Get the base64 image data from the request
         data = request.get_json()
@@ -1085,13 +1921,11 @@ def capture():
         image_data = data['image'].split(',')[1]  # Remove the data URL prefix
         image_bytes = base64.b64decode(image_data)
         
-        # Save the image temporarily
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'capture.jpg')
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
+        image = decode_image_bytes(image_bytes)
+        save_upload_async(image_bytes, 'capture.jpg')
         
         # Check if it's a grape leaf
-        is_leaf, leaf_message = is_grape_leaf_image(filepath)
+        is_leaf, leaf_message = is_grape_leaf_image(image)
         
         if not is_leaf:
             result = {
@@ -1102,32 +1936,16 @@ def capture():
             }
             return jsonify(result)
         
-        # Preprocess and predict
-        img = preprocess_image(filepath)
-        pred = model.predict(img)[0]
-        predicted_class_index = np.argmax(pred)
-        predicted_disease = class_names[predicted_class_index]
-        confidence = float(pred[predicted_class_index])
-        
-        # Get disease information
-        disease_data = disease_info.get(predicted_disease, {})
-        symptoms = disease_data.get('symptoms', [])
-        pesticides = disease_data.get('pesticides', [])
-        prevention = disease_data.get('prevention', [])
-        
-        result = {
-            'prediction': predicted_disease,
-            'confidence': confidence,
-            'message': f'This grape leaf appears to have {predicted_disease} with {confidence:.2%} confidence.',
-            'is_leaf': True,
-            'disease_info': {
-                'symptoms': symptoms,
-                'pesticides': pesticides,
-                'prevention': prevention
-            }
-        }
+        # Preprocess and predict (or reuse the cached result for this image)
+        result = diagnose_leaf_image(image)
         return jsonify(result)
     
+    except InferenceServiceError as e:
+        return jsonify({
+            'error': str(e), 
+            'is_leaf': True
+        }), 503
+    
     except Exception as e:
         return jsonify({
             'error': str(e), 
@@ -1158,7 +1976,7 @@ def get_weather():
         return jsonify({"error": "Invalid request parameters"}), 400
     
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         weather_data = response.json()
         
@@ -1182,36 +2000,25 @@ def get_weather():
 @app.route('/predict_disease', methods=['POST'])
 def predict_disease():
     # Lazy load models on first use
-    load_models_if_needed()
+    load_weather_model_if_needed()
     
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Send a JSON object with temp, humidity, wind_speed and precipitation"}), 400
     
     try:
-        # Extract weather data
-        temp = data['temp']
-        humidity = data['humidity']
-        wind_speed = data['wind_speed']
-        precipitation = data['precipitation']
-        
-        # Prepare input for the model
-        numerical_features = np.array([[temp, humidity, wind_speed, precipitation, 0]])
-        
-        # Scale the numerical features
-        numerical_features_scaled = scaler.transform(numerical_features)
-        
-        # Ensure the input shape matches model expectations
-        if numerical_features_scaled.shape[1] != 5:
-            raise ValueError(f"Expected 5 input features, but got {numerical_features_scaled.shape[1]} features.")
-        
-        # Make prediction
-        prediction = weather_model.predict(numerical_features_scaled)
+        # Every field must be present and numeric
+        observation = observations_to_array([data])
+    except ValueError as e:
+        return jsonify({"error": f"Invalid input: {str(e)}"}), 400
+    
+    try:
+        # Scale and score the observation (same path as /predict_disease/batch)
+        prediction = predict_disease_probabilities(observation, scaler, weather_model, risk_grid)
         
         # Get the predicted disease
         disease_index = np.argmax(prediction, axis=1)[0]
-        
-        # Map the disease index to the disease name
-        disease_classes = ['Black Rot', 'Leaf Blight', 'ESCA', 'Healthy']
-        predicted_disease = disease_classes[disease_index]
+        predicted_disease = DISEASE_CLASSES[disease_index]
         
         # Get recommendations for the predicted disease
         disease_recommendations = get_disease_recommendations(predicted_disease)
@@ -1223,6 +2030,8 @@ def predict_disease():
         }
         
         return jsonify(result)
+    except InferenceServiceError as e:
+        return jsonify({"error": f"Prediction Error: {str(e)}"}), 503
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -1231,6 +2040,131 @@ def predict_disease():
             "details": error_details
         }), 500
 
+@app.route('/predict_disease/batch', methods=['POST'])
+def predict_disease_batch():
+    """
+    Predict the disease risk for many weather observations at once.
+    Accepts JSON ({"observations": [...]}, rows as objects or [temp, humidity, wind_speed, precipitation])
+    or CSV (uploaded file or text/csv body). Streams NDJSON, or CSV with ?format=csv.
+    """
+    # Lazy load models on first use
+    load_weather_model_if_needed()
+    
+    try:
+        if 'file' in request.files:
+            observations = read_observations_csv(request.files['file'].read())
+        elif request.mimetype == 'text/csv':
+            observations = read_observations_csv(request.get_data())
+        else:
+            data = request.get_json(silent=True) or {}
+            observations = observations_to_array(data.get('observations') or [])
+    except Exception as e:
+        return jsonify({"error": f"Invalid observations: {str(e)}"}), 400
+    if len(observations) == 0:
+        return jsonify({"error": "No observations provided"}), 400
+    
+    as_csv = request.args.get('format', 'json').lower() == 'csv'
+    
+    def generate():
+        if as_csv:
+            yield ','.join(WEATHER_FEATURES + ['predicted_disease', 'confidence']) + '\n'
+        try:
+            for start, indices, confidences in iter_disease_predictions(observations, scaler, weather_model, grid=risk_grid):
+                rows = observations[start:start + len(indices)]
+                if as_csv:
+                    yield ''.join(
+                        ','.join(f"{v:g}" for v in row) + f",{DISEASE_CLASSES[i]},{c:.6f}\n"
+                        for row, i, c in zip(rows, indices, confidences)
+                    )
+                else:
+                    yield ''.join(
+                        json.dumps({
+                            'row': start + offset,
+                            'predicted_disease': DISEASE_CLASSES[i],
+                            'confidence': float(c)
+                        }) + '\n'
+                        for offset, (i, c) in enumerate(zip(indices, confidences))
+                    )
+        except Exception as e:
+            # Headers are already sent; report the failure in-band and stop
+            yield f"# error: {str(e)}\n" if as_csv else json.dumps({'error': str(e)}) + '\n'
+            return
+        
+        if not as_csv:
+            yield json.dumps({'rows': len(observations), 'done': True}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='text/csv' if as_csv else 'application/x-ndjson')
+
+@app.route('/predict_disease/forecast', methods=['POST'])
+def predict_disease_forecast():
+    """
+    Disease risk timeline over a multi-day forecast.
+    Send {"city": ...} or {"lat": ..., "lon": ...} to use the OpenWeather forecast, or
+    {"forecast": [...]} with your own rows. With "farm_id", high-risk days become farm alerts.
+    """
+    # Lazy load models on first use
+    load_weather_model_if_needed()
+    
+    data = request.get_json(silent=True) or {}
+    
+    # The farm is checked before any forecast is fetched or scored
+    farm_id = data.get('farm_id')
+    if farm_id:
+        if not (isinstance(farm_id, str) and ObjectId.is_valid(farm_id)):
+            return jsonify({"error": "Invalid farm_id"}), 400
+        if 'user_id' not in session:
+            return jsonify({"error": "Not authenticated"}), 401
+        farm = get_farm_by_id(farm_id)
+        if not farm or str(farm['user_id']) != session['user_id']:
+            return jsonify({"error": "Farm not found"}), 404
+    
+    try:
+        if 'forecast' in data:
+            forecast = data['forecast']
+        elif 'lat' in data and 'lon' in data:
+            forecast = get_forecast_data(lat=data['lat'], lon=data['lon'])
+        elif 'city' in data:
+            forecast = get_forecast_data(city=data['city'])
+        else:
+            return jsonify({"error": "Provide city, lat/lon or a forecast"}), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not fetch the weather forecast: {str(e)}"}), 502
+    if forecast is None:
+        return jsonify({"error": "Could not fetch the weather forecast"}), 502
+    
+    try:
+        # The whole horizon is scaled and scored as one batch
+        result = forecast_risk(forecast, scaler, weather_model, risk_grid)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid forecast: {str(e)}"}), 400
+    except InferenceServiceError as e:
+        return jsonify({"error": f"Prediction Error: {str(e)}"}), 503
+    
+    if isinstance(forecast, dict) and isinstance(forecast.get('city'), dict):
+        result['location'] = forecast['city'].get('name')
+    
+    if farm_id:
+        result['alerts_created'] = create_disease_risk_alerts(session['user_id'], farm_id, result['alerts'])
+    
+    return jsonify(result)
+
+def create_disease_risk_alerts(user_id, farm_id, risk_alerts):
+    """Turn forecast risk alerts into farm alerts, once per disease and day"""
+    created = 0
+    for alert in risk_alerts:
+        alert_date = datetime.strptime(alert['date'], '%Y-%m-%d')
+        existing_alert = db.alerts.find_one({
+            "user_id": ObjectId(user_id),
+            "farm_id": ObjectId(farm_id),
+            "type": "disease_risk",
+            "date": alert_date,
+            "message": {'$regex': f"^High {alert['disease']} risk"}
+        })
+        if not existing_alert:
+            create_alert(user_id, farm_id, alert['message'], "disease_risk", alert_date)
+            created += 1
+    return created
+
 def get_farming_recommendations(weather_data):
     """Generate farming recommendations based on weather data"""
     recommendations = {}
@@ -1860,7 +2794,7 @@ def get_weather_insights():
             }
         }
         
-        response = requests.post(
+        response = http_client.post(
             url,
             headers={"Content-Type": "application/json"},
             data=json.dumps(payload)
@@ -2681,13 +3615,36 @@ def check_upcoming_tasks():
 
 
 
-# Initialize database and load sample data
-init_db()
+# Database setup runs on the first request of each process (or during its warm start), never at
+# import: a preloading gunicorn master must fork its workers without a connected MongoDB client
+_database_ready_pid = None
+_database_lock = threading.Lock()
+
+def init_database():
+    """Create indexes and load sample products and grape varieties, once per process"""
+    global _database_ready_pid
+    if _database_ready_pid == os.getpid():
+        return
+    with _database_lock:
+        if _database_ready_pid == os.getpid():
+            return
+        try:
+            init_db()
+            
+            # Check if products exist, if not load sample data
+            if products_collection.count_documents({}) == 0:
+                print("No products found. Loading sample data...")
+                load_sample_data()
+            
+            init_grape_varieties()
+            _database_ready_pid = os.getpid()
+        except Exception as e:
+            # Tried again on the next request
+            print(f"Database setup failed: {e}")
 
-# Check if products exist, if not load sample data
-if products_collection.count_documents({}) == 0:
-    print("No products found. Loading sample data...")
-    load_sample_data()
+@app.before_request
+def ensure_database():
+    init_database()
 
 # Helper function to get cart from session
 def get_cart():
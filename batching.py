@@ -0,0 +1,141 @@
+"""Dynamic micro-batching for model inference.
+
+Requests that arrive within a short window are stacked into a single batch,
+run through the model in one forward pass, and each caller gets back only
+its own rows.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+# Batching window and batch size limits (configurable from the environment)
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '10'))
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+
+
+class _PendingRequest:
+    """A single caller waiting for its slice of a batched prediction"""
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.rows = inputs.shape[0]
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collect concurrent predict calls and run them as one batch.
+
+    predict_fn receives a stacked batch of shape (N, ...) and must return an
+    array whose first dimension is N.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=BATCH_MAX_SIZE, window_ms=BATCH_WINDOW_MS, name='model'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+        # Counters exposed through stats()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_seen_batch = 0
+
+    def _ensure_started(self):
+        """Start the batching thread (again after a fork, threads don't survive it)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+            self._thread.start()
+
+    def predict(self, inputs, timeout=None):
+        """Queue inputs of shape (n, ...) and block until their predictions are ready"""
+        inputs = np.asarray(inputs)
+        if inputs.ndim == 0:
+            raise ValueError("Batched inputs must have a leading batch dimension")
+
+        self._ensure_started()
+        pending = _PendingRequest(inputs)
+        self._queue.put(pending)
+
+        if not pending.done.wait(timeout):
+            raise TimeoutError(f"Timed out waiting for {self.name} prediction")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self, first):
+        """Gather requests arriving within the batching window"""
+        batch = [first]
+        rows = first.rows
+        deadline = time.monotonic() + self.window
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            rows += pending.rows
+        return batch, rows
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch, rows = self._collect(first)
+
+            try:
+                if len(batch) == 1:
+                    stacked = first.inputs
+                else:
+                    stacked = np.concatenate([p.inputs for p in batch], axis=0)
+                outputs = np.asarray(self.predict_fn(stacked))
+
+                # Hand each caller back its own rows
+                offset = 0
+                for pending in batch:
+                    pending.result = outputs[offset:offset + pending.rows]
+                    offset += pending.rows
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += rows
+            self.max_seen_batch = max(self.max_seen_batch, rows)
+
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self):
+        """Batching counters for health/metrics endpoints"""
+        return {
+            'window_ms': self.window * 1000.0,
+            'max_batch_size': self.max_batch_size,
+            'batches': self.batches,
+            'requests': self.requests,
+            'rows': self.rows,
+            'avg_batch_size': round(self.rows / self.batches, 2) if self.batches else 0.0,
+            'max_seen_batch': self.max_seen_batch,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0
+        }
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Measure single-image inference latency of the grape disease models.
+
+With --int8 it also compares the float and INT8 image models, and with --tta
+it measures test-time augmentation, on a labelled directory of leaf photos
+(one sub-directory per class, named like class_names in app.py), printing an
+accuracy-vs-latency report.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+# Same order as class_names in app.py
+CLASS_NAMES = ['Black Rot', 'Leaf Blight', 'Healthy', 'ESCA']
+
+
+def percentile_ms(samples, q):
+    """Percentile of a list of durations (seconds), in milliseconds"""
+    return float(np.percentile(samples, q) * 1000)
+
+
+def time_calls(fn, x, runs, warmup=5):
+    """Call fn(x) repeatedly and return per-call durations in seconds"""
+    for _ in range(warmup):
+        fn(x)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<32} p50={percentile_ms(samples, 50):8.2f} ms   p95={percentile_ms(samples, 95):8.2f} ms")
+
+
+def benchmark_latency(runs):
+    """Compare Keras model.predict against the traced inference path"""
+    from tensorflow.keras.models import load_model
+    from inference import GraphModel
+
+    for path, name in [('grape_model.h5', 'grape_model'), ('grape_leaf_disease_model.h5', 'weather_model')]:
+        keras_model = load_model(path, compile=False)
+        graph_model = GraphModel(keras_model, name=name)
+        graph_model.warmup()
+        x = np.random.rand(1, *graph_model.input_shape).astype('float32')
+
+        print(f"\n{path}")
+        report("keras model.predict", time_calls(lambda b: keras_model.predict(b, verbose=0), x, runs))
+        report("traced tf.function", time_calls(graph_model.predict, x, runs))
+
+
+def load_labelled_images(labelled_dir, target_size=(224, 224)):
+    """Load <labelled_dir>/<class name>/*.jpg into (images, label indices)"""
+    from convert_models import load_sample_images
+
+    images, labels = [], []
+    for index, class_name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(labelled_dir, class_name)
+        if not os.path.isdir(class_dir):
+            print(f"⚠ No directory for class '{class_name}' in {labelled_dir}")
+            continue
+        class_images = load_sample_images(class_dir, target_size, limit=10000)
+        if class_images is None:
+            continue
+        images.append(class_images)
+        labels.extend([index] * len(class_images))
+    if not images:
+        raise ValueError(f"No labelled images found in {labelled_dir}")
+    return np.concatenate(images, axis=0), np.array(labels)
+
+
+def evaluate(inference_model, images, labels, runs):
+    """Per-class accuracy and single-image latency of one model variant"""
+    predictions = np.concatenate([
+        np.argmax(inference_model.predict(images[i:i + 32]), axis=1)
+        for i in range(0, len(images), 32)
+    ])
+    per_class = {}
+    for index, class_name in enumerate(CLASS_NAMES):
+        mask = labels == index
+        per_class[class_name] = float(np.mean(predictions[mask] == index)) if mask.any() else None
+    samples = time_calls(inference_model.predict, images[:1], runs)
+    return {
+        'accuracy': float(np.mean(predictions == labels)),
+        'per_class': per_class,
+        'p50_ms': percentile_ms(samples, 50),
+        'p95_ms': percentile_ms(samples, 95)
+    }
+
+
+def benchmark_int8(labelled_dir, runs):
+    """Accuracy-vs-latency report for the float and INT8 TFLite exports of grape_model"""
+    from inference import load_inference_model, tflite_path
+
+    images, labels = load_labelled_images(labelled_dir)
+    print(f"\nLoaded {len(images)} labelled images from {labelled_dir}")
+
+    # Both variants run on the TFLite interpreter, so size and latency differ only by quantization
+    variants = {'float': load_inference_model('grape_model.h5', name='grape_model', backend='tflite')}
+    variants['int8'] = load_inference_model('grape_model.h5', name='grape_model', variant='int8')
+    results = {name: evaluate(m, images, labels, runs) for name, m in variants.items()}
+
+    sizes = {
+        'float': os.path.getsize(tflite_path('grape_model.h5')),
+        'int8': os.path.getsize(tflite_path('grape_model.h5', variant='int8'))
+    }
+
+    lines = [
+        "| Variant | Size (MB) | p50 (ms) | p95 (ms) | Accuracy | " + " | ".join(CLASS_NAMES) + " |",
+        "|---" * (5 + len(CLASS_NAMES)) + "|"
+    ]
+    for name, result in results.items():
+        per_class = [
+            f"{result['per_class'][c]:.2%}" if result['per_class'][c] is not None else "n/a"
+            for c in CLASS_NAMES
+        ]
+        lines.append(
+            f"| {name} | {sizes[name] / 1e6:.1f} | {result['p50_ms']:.2f} | {result['p95_ms']:.2f} | "
+            f"{result['accuracy']:.2%} | " + " | ".join(per_class) + " |"
+        )
+    report = "\n".join(lines)
+
+    print()
+    print(report)
+    return f"# grape_model float vs INT8 ({len(images)} images, {runs} timed runs)\n\n{report}\n"
+
+
+def benchmark_tta(labelled_dir, runs, threshold):
+    """Accuracy-vs-latency report for test-time augmentation on grape_model"""
+    from inference import load_inference_model
+    from tta import TTA_VIEW_NAMES, tta_predict
+
+    images, labels = load_labelled_images(labelled_dir)
+    print(f"\nLoaded {len(images)} labelled images from {labelled_dir}")
+    grape_model = load_inference_model('grape_model.h5', name='grape_model')
+
+    first_pass = np.concatenate([grape_model.predict(images[i:i + 32]) for i in range(0, len(images), 32)])
+    always = np.concatenate([
+        tta_predict(grape_model.predict, images[i:i + 4], first_pass[i:i + 4])
+        for i in range(0, len(images), 4)
+    ])
+    uncertain = np.max(first_pass, axis=1) < threshold
+    gated = np.where(uncertain[:, np.newaxis], always, first_pass)
+
+    def accuracy(preds):
+        return float(np.mean(np.argmax(preds, axis=1) == labels))
+
+    # Single-image latency of the first pass alone and of the first pass plus all views
+    x = images[:1]
+    plain_samples = time_calls(grape_model.predict, x, runs)
+    tta_samples = time_calls(lambda b: tta_predict(grape_model.predict, b, grape_model.predict(b)), x, runs)
+    triggered = float(np.mean(uncertain))
+    gated_mean = np.mean(plain_samples) + triggered * (np.mean(tta_samples) - np.mean(plain_samples))
+
+    lines = [
+        "| Mode | TTA applied | Accuracy | p50 (ms) | p95 (ms) | Mean (ms) |",
+        "|---|---|---|---|---|---|",
+        f"| first pass only | 0% | {accuracy(first_pass):.2%} | {percentile_ms(plain_samples, 50):.2f} | "
+        f"{percentile_ms(plain_samples, 95):.2f} | {np.mean(plain_samples) * 1000:.2f} |",
+        f"| TTA below {threshold:.2f} confidence | {triggered:.1%} | {accuracy(gated):.2%} | - | - | {gated_mean * 1000:.2f} |",
+        f"| TTA on every image | 100% | {accuracy(always):.2%} | {percentile_ms(tta_samples, 50):.2f} | "
+        f"{percentile_ms(tta_samples, 95):.2f} | {np.mean(tta_samples) * 1000:.2f} |"
+    ]
+    report = "\n".join(lines)
+
+    print()
+    print(report)
+    return (
+        f"# grape_model test-time augmentation ({len(images)} images, {len(TTA_VIEW_NAMES) + 1} views, "
+        f"{runs} timed runs)\n\n{report}\n"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=100, help='timed calls per model')
+    parser.add_argument('--int8', metavar='LABELLED_DIR', help='compare float and INT8 grape_model on labelled leaf photos')
+    parser.add_argument('--tta', metavar='LABELLED_DIR', help='measure test-time augmentation on labelled leaf photos')
+    parser.add_argument('--tta-threshold', type=float, default=None, help='confidence below which TTA kicks in (default: TTA_CONFIDENCE_THRESHOLD)')
+    parser.add_argument('--report', help='write the INT8/TTA comparisons as markdown tables to this file')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Single-image inference latency (CPU)")
+    print("=" * 60)
+    benchmark_latency(args.runs)
+
+    sections = []
+    if args.int8:
+        sections.append(benchmark_int8(args.int8, args.runs))
+    if args.tta:
+        from tta import TTA_CONFIDENCE_THRESHOLD
+        threshold = args.tta_threshold if args.tta_threshold is not None else TTA_CONFIDENCE_THRESHOLD
+        sections.append(benchmark_tta(args.tta, args.runs, threshold))
+
+    if args.report and sections:
+        with open(args.report, 'w') as f:
+            f.write("\n".join(sections))
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Precompute the weather disease model over a grid of its four inputs.
+
+Writes risk_grid.npy (float16 probabilities, memory-mapped by the app) and
+risk_grid.json (the grid axes and a fingerprint of the model and scaler).
+/predict_disease then interpolates in the grid and only calls the model for
+observations outside it. Rebuild after retraining the model or the scaler;
+a grid built from other files is ignored.
+"""
+import argparse
+import os
+import sys
+
+import joblib
+import numpy as np
+
+from disease_risk import (
+    DISEASE_CLASSES, RISK_GRID_PATH, RISK_GRID_SOURCES, RiskGrid, WEATHER_FEATURES, build_risk_grid,
+    model_probabilities
+)
+from inference import dense_weights_path, load_inference_model
+
+# Default (start, stop, points) per input, covering field conditions
+DEFAULT_AXES = {
+    'temp': (-10.0, 50.0, 61),
+    'humidity': (0.0, 100.0, 41),
+    'wind_speed': (0.0, 40.0, 21),
+    'precipitation': (0.0, 50.0, 26)
+}
+
+# Random in-grid observations used to measure the interpolation error
+VALIDATION_SIZE = 20000
+
+
+def parse_axis(text):
+    start, stop, points = text.split(':')
+    return float(start), float(stop), int(points)
+
+
+def load_weather_model():
+    """Same model the app serves: the NumPy export when present, otherwise the configured backend"""
+    path = 'grape_leaf_disease_model.h5'
+    backend = 'numpy' if os.path.exists(dense_weights_path(path)) else None
+    return load_inference_model(path, name='weather_model', backend=backend, warmup=False)
+
+
+def validate(grid, scaler, weather_model, size=VALIDATION_SIZE):
+    """Interpolation error against the model on random observations inside the grid"""
+    rng = np.random.default_rng(0)
+    observations = rng.uniform(grid.start, grid.stop, size=(size, len(WEATHER_FEATURES)))
+    expected = model_probabilities(observations, scaler, weather_model)
+    actual = grid.lookup(observations)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    same_class = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    print(f"  max |model - grid| = {max_diff:.2e}, argmax agreement = {same_class:.2%} over {size} observations")
+    return same_class
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', default=RISK_GRID_PATH, help='path of the .npy grid')
+    for feature, (start, stop, points) in DEFAULT_AXES.items():
+        parser.add_argument(
+            f'--{feature.replace("_", "-")}', type=parse_axis, default=(start, stop, points),
+            metavar='START:STOP:POINTS', help=f'{feature} axis (default {start:g}:{stop:g}:{points})'
+        )
+    args = parser.parse_args()
+
+    axes = [getattr(args, feature) for feature in WEATHER_FEATURES]
+    scaler = joblib.load('scaler.pkl')
+    weather_model = load_weather_model()
+
+    print("=" * 60)
+    print("Building disease risk grid...")
+    print("=" * 60)
+    points = build_risk_grid(scaler, weather_model, axes, path=args.output, source_paths=RISK_GRID_SOURCES)
+    size = os.path.getsize(args.output)
+    print(f"✓ Wrote {args.output}: {points:,} points x {len(DISEASE_CLASSES)} classes ({size / 1e6:.1f} MB)")
+
+    agreement = validate(RiskGrid(args.output), scaler, weather_model)
+    if agreement < 0.99:
+        print("⚠ WARNING: the grid disagrees with the model on more than 1% of observations, use more points")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Response cache for the text chatbot (/api/chat).
+
+Two layers, both bounded by CHAT_CACHE_SIZE entries and CHAT_CACHE_TTL seconds:
+
+- exact: the normalized question (lower case, punctuation and extra spaces
+  removed) maps straight to the stored answer;
+- semantic (off by default): every stored question also has a hashed
+  character n-gram vector; a new question is answered from its nearest
+  stored neighbour when their cosine similarity reaches CHAT_CACHE_SIMILARITY
+  and both mention the same numbers.
+
+Entries live in the worker's memory and the least recently used one is
+evicted first.
+"""
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '1024'))
+CHAT_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', str(24 * 3600)))
+# Cosine similarity needed for a semantic hit. The default (above 1) keeps exact matches only;
+# lower it only after checking it against labelled paraphrase / non-paraphrase question pairs
+CHAT_CACHE_SIMILARITY = float(os.getenv('CHAT_CACHE_SIMILARITY', '1.01'))
+
+# Hashed n-gram vector size and the character n-gram lengths it counts
+EMBEDDING_DIM = 2048
+NGRAM_SIZES = (3, 4)
+# Words that change the phrasing of a question but not what is asked. Question words and
+# modal verbs are kept: "when should I prune" and "how should I prune" are different questions
+FILLER_WORDS = frozenset('a an the i me my we our you your please to of for in on at it this that there tell about'.split())
+
+
+def normalize_message(text):
+    """Lower case, letters and digits only, single spaces"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', text.lower()).split())
+
+
+def message_numbers(normalized):
+    """Digit tokens of a normalized message ("30 degrees" and "40 degrees" must not match)"""
+    return tuple(re.findall(r'\d+', normalized))
+
+
+def embed_message(normalized, dim=EMBEDDING_DIM):
+    """Unit-length hashed character n-gram counts of a normalized message's content words"""
+    words = [word for word in normalized.split() if word not in FILLER_WORDS] or normalized.split()
+    padded = f' {" ".join(words)} '
+    buckets = [
+        zlib.crc32(padded[i:i + n].encode('utf-8')) % dim
+        for n in NGRAM_SIZES
+        for i in range(len(padded) - n + 1)
+    ]
+    vector = np.bincount(buckets, minlength=dim).astype(np.float32) if buckets else np.zeros(dim, np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ChatCache:
+    """Exact and nearest-neighbour answers for repeated chat questions"""
+
+    def __init__(self, max_entries=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL, similarity=CHAT_CACHE_SIMILARITY, dim=EMBEDDING_DIM):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.similarity = similarity
+        self.dim = dim
+        # normalized question -> (answer, created_at, slot in the vector index)
+        self._entries = OrderedDict()
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        _, _, slot = self._entries.pop(key)
+        self._vectors[slot] = 0.0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _nearest(self, vector):
+        """Stored question most similar to vector, with its similarity"""
+        similarities = self._vectors @ vector
+        slot = int(np.argmax(similarities))
+        return self._slot_keys[slot], float(similarities[slot])
+
+    def get(self, message):
+        """Cached answer for message, or None"""
+        key = normalize_message(message)
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] >= self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+
+            if self._entries and self.similarity <= 1.0:
+                neighbour, similarity = self._nearest(embed_message(key, self.dim))
+                if (neighbour is not None and similarity >= self.similarity
+                        and message_numbers(neighbour) == message_numbers(key)):
+                    answer, created_at, _ = self._entries[neighbour]
+                    if now - created_at < self.ttl:
+                        self._entries.move_to_end(neighbour)
+                        self.semantic_hits += 1
+                        return answer
+                    self._remove(neighbour)
+
+            self.misses += 1
+            return None
+
+    def set(self, message, answer):
+        key = normalize_message(message)
+        if not key:
+            return
+        vector = embed_message(key, self.dim)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while not self._free_slots:
+                self._remove(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._slot_keys[slot] = key
+            self._entries[key] = (answer, time.time(), slot)
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            'exact_hits': self.exact_hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            'size': len(self._entries)
+        }
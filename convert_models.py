@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Export the Keras disease models to TFLite and check them against Keras.
+
+The .tflite files let web workers run with MODEL_BACKEND=tflite, which only
+needs the TFLite interpreter (tflite-runtime) instead of full TensorFlow.
+With --int8 it also writes grape_model_int8.tflite, a post-training INT8
+quantized variant calibrated on leaf photos (GRAPE_MODEL_VARIANT=int8).
+
+The weather disease model is also exported to grape_leaf_disease_model.npz,
+its dense-layer weights for the NumPy-only evaluator, which lets
+/predict_disease run without TensorFlow.
+"""
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+from inference import DENSE_ACTIVATIONS, NumpyDenseModel, TFLiteModel, dense_weights_path, tflite_path
+
+MODEL_FILES = ['grape_model.h5', 'grape_leaf_disease_model.h5']
+
+# Maximum absolute difference allowed between Keras and TFLite softmax outputs
+TOLERANCE = 1e-4
+
+# Model exported to .npz for the NumPy evaluator, and how closely it must match Keras
+DENSE_MODEL_FILE = 'grape_leaf_disease_model.h5'
+DENSE_TOLERANCE = 1e-5
+
+# Number of leaf photos fed to the INT8 calibration
+CALIBRATION_SIZE = 200
+
+
+def load_sample_images(image_dir, target_size, limit=32, recursive=False):
+    """Load leaf photos the same way preprocess_image() does"""
+    paths = []
+    for pattern in ('*.jpg', '*.jpeg', '*.png'):
+        if recursive:
+            paths.extend(glob.glob(os.path.join(image_dir, '**', pattern), recursive=True))
+        else:
+            paths.extend(glob.glob(os.path.join(image_dir, pattern)))
+    images = []
+    for path in sorted(paths)[:limit]:
+        img = Image.open(path).convert('RGB').resize(target_size)
+        images.append(np.array(img, dtype='float32') / 255.)
+    return np.stack(images) if images else None
+
+
+def sample_inputs(keras_model, image_dir):
+    """Inputs used to compare Keras and TFLite outputs"""
+    input_shape = tuple(keras_model.input_shape[1:])
+    rng = np.random.default_rng(0)
+
+    if len(input_shape) == 3:
+        # Image model: real leaf photos when available, plus random images
+        samples = [rng.random((8,) + input_shape, dtype=np.float32)]
+        if image_dir:
+            images = load_sample_images(image_dir, input_shape[:2])
+            if images is not None:
+                samples.append(images)
+        return np.concatenate(samples, axis=0)
+
+    # Weather model: inputs are standard-scaled features
+    return rng.normal(size=(256,) + input_shape).astype(np.float32)
+
+
+def convert(h5_path):
+    """Convert one .h5 model to a float TFLite model next to it"""
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(h5_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    tflite_model = converter.convert()
+
+    output_path = tflite_path(h5_path)
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"✓ Wrote {output_path} ({len(tflite_model):,} bytes)")
+    return keras_model, output_path
+
+
+def convert_int8(h5_path, calibration_dir):
+    """Post-training INT8 quantization of the image model, calibrated on leaf photos"""
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(h5_path, compile=False)
+    input_shape = tuple(keras_model.input_shape[1:])
+    calibration = load_sample_images(calibration_dir, input_shape[:2], limit=CALIBRATION_SIZE, recursive=True)
+    if calibration is None:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+    print(f"  calibrating on {len(calibration)} images from {calibration_dir}")
+
+    def representative_dataset():
+        for image in calibration:
+            yield [image[np.newaxis, ...]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # Weights and activations are int8; the float input/output keeps preprocess_image() unchanged
+    tflite_model = converter.convert()
+
+    output_path = tflite_path(h5_path, variant='int8')
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"✓ Wrote {output_path} ({len(tflite_model):,} bytes, was {os.path.getsize(h5_path):,} as .h5)")
+    return keras_model, output_path
+
+
+def export_dense_weights(h5_path):
+    """Write the weights of a dense-only Keras model to .npz for NumpyDenseModel"""
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(h5_path, compile=False)
+    specs, arrays = [], {}
+    for layer in keras_model.layers:
+        layer_type = type(layer).__name__
+        if layer_type in ('InputLayer', 'Dropout'):
+            # Dropout is the identity at inference time
+            continue
+
+        i = len(specs)
+        if layer_type == 'Dense':
+            activation = layer.activation.__name__
+            arrays[f'W{i}'] = layer.kernel.numpy().astype(np.float32)
+            bias = layer.bias.numpy() if layer.use_bias else np.zeros(layer.units)
+            arrays[f'b{i}'] = bias.astype(np.float32)
+            specs.append(f'dense:{activation}')
+        elif layer_type == 'BatchNormalization':
+            # Inference-time batch norm is a per-feature affine transform
+            mean = layer.moving_mean.numpy()
+            variance = layer.moving_variance.numpy()
+            gamma = layer.gamma.numpy() if layer.scale else np.ones_like(mean)
+            beta = layer.beta.numpy() if layer.center else np.zeros_like(mean)
+            scale = gamma / np.sqrt(variance + layer.epsilon)
+            arrays[f'scale{i}'] = scale.astype(np.float32)
+            arrays[f'offset{i}'] = (beta - mean * scale).astype(np.float32)
+            activation = 'linear'
+            specs.append(f'affine:{activation}')
+        elif layer_type == 'Activation':
+            activation = layer.activation.__name__
+            specs.append(f'activation:{activation}')
+        else:
+            raise ValueError(f"{h5_path}: layer '{layer.name}' ({layer_type}) is not supported by the NumPy evaluator")
+
+        if activation not in DENSE_ACTIVATIONS:
+            raise ValueError(f"{h5_path}: activation '{activation}' of layer '{layer.name}' is not supported")
+
+    output_path = dense_weights_path(h5_path)
+    np.savez(
+        output_path,
+        layers=np.array(specs),
+        input_shape=np.array(keras_model.input_shape[1:]),
+        **arrays
+    )
+    print(f"✓ Wrote {output_path} ({len(specs)} layers: {', '.join(specs)})")
+    return keras_model, output_path
+
+
+def verify_dense(keras_model, output_path):
+    """Compare NumPy evaluator outputs against Keras, returns the max abs difference"""
+    x = sample_inputs(keras_model, None)
+    expected = keras_model(x, training=False).numpy()
+    actual = NumpyDenseModel(output_path, name=output_path).predict(x)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    print(f"  max |keras - numpy| = {max_diff:.2e} over {len(x)} inputs")
+    return max_diff
+
+
+def verify(keras_model, output_path, image_dir):
+    """Compare TFLite predictions against Keras, returns the max abs difference"""
+    x = sample_inputs(keras_model, image_dir)
+    expected = keras_model(x, training=False).numpy()
+    actual = TFLiteModel(output_path, name=output_path).predict(x)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    same_class = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    print(f"  max |keras - tflite| = {max_diff:.2e}, argmax agreement = {same_class:.2%} over {len(x)} inputs")
+    return max_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', default='static', help='directory of leaf photos used for the comparison')
+    parser.add_argument('--int8', action='store_true', help='also write the INT8 quantized grape_model variant')
+    parser.add_argument('--calibration', default='static', help='directory (searched recursively) of leaf photos for INT8 calibration')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Converting models to TFLite...")
+    print("=" * 60)
+
+    failed = []
+    for h5_path in MODEL_FILES:
+        if not os.path.exists(h5_path):
+            print(f"⚠ {h5_path} not found, run download_models.py first")
+            failed.append(h5_path)
+            continue
+        keras_model, output_path = convert(h5_path)
+        if verify(keras_model, output_path, args.images) > TOLERANCE:
+            print(f"✗ {output_path} differs from Keras by more than {TOLERANCE}")
+            failed.append(h5_path)
+
+    if os.path.exists(DENSE_MODEL_FILE):
+        keras_model, output_path = export_dense_weights(DENSE_MODEL_FILE)
+        if verify_dense(keras_model, output_path) > DENSE_TOLERANCE:
+            print(f"✗ {output_path} differs from Keras by more than {DENSE_TOLERANCE}")
+            failed.append(output_path)
+
+    if args.int8 and os.path.exists('grape_model.h5'):
+        # Quantization error is expected, so only report the drift here;
+        # benchmark_models.py --int8 measures the accuracy impact on labelled photos
+        keras_model, output_path = convert_int8('grape_model.h5', args.calibration)
+        verify(keras_model, output_path, args.images)
+
+    print("=" * 60)
+    if failed:
+        print(f"⚠ WARNING: {len(failed)} model(s) failed: {', '.join(failed)}")
+        sys.exit(1)
+    print("All models converted within tolerance")
+
+
+if __name__ == '__main__':
+    main()
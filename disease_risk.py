@@ -0,0 +1,344 @@
+"""Weather-based grape disease prediction for many observations at once.
+
+An observation is (temp, humidity, wind_speed, precipitation). Observations
+are scaled with one scaler.transform call and scored with one model call per
+chunk, so thousands of rows cost a handful of forward passes.
+
+forecast_risk() scores a whole multi-day weather forecast the same way and
+summarises it as a per-class risk timeline with day-level alerts.
+
+Observations can also be answered from a precomputed risk grid (see
+build_risk_grid.py): the model's output over a regular grid of the four
+inputs, memory-mapped and interpolated. Rows outside the grid still go
+through the model.
+"""
+import hashlib
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+# Output order of grape_leaf_disease_model.h5 (differs from the image model's class_names)
+DISEASE_CLASSES = ['Black Rot', 'Leaf Blight', 'ESCA', 'Healthy']
+
+# Input columns, in the order the scaler was fitted on (a fifth, constant 0 column follows)
+WEATHER_FEATURES = ['temp', 'humidity', 'wind_speed', 'precipitation']
+
+# Rows per scaler/model call in the batch path
+DISEASE_BATCH_CHUNK = int(os.getenv('DISEASE_BATCH_CHUNK', '4096'))
+
+# A disease whose forecast probability reaches this on some day raises an alert for that day
+FORECAST_ALERT_THRESHOLD = float(os.getenv('FORECAST_ALERT_THRESHOLD', '0.7'))
+
+# Precomputed risk grid written by build_risk_grid.py (the .json next to it holds the axes)
+RISK_GRID_PATH = os.getenv('RISK_GRID_PATH', 'risk_grid.npy')
+# Files the grid is computed from (a change to either makes the grid stale)
+RISK_GRID_SOURCES = ['scaler.pkl', 'grape_leaf_disease_model.h5']
+
+
+def _observation_value(observation, feature, row=0):
+    """One feature of a dict observation as a float; ValueError names the row and field"""
+    if not isinstance(observation, dict):
+        raise ValueError(f"Observation {row} must be an object")
+    if feature not in observation:
+        raise ValueError(f"Observation {row} is missing '{feature}'")
+    value = observation[feature]
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Observation {row} has a non-numeric '{feature}': {value!r}")
+
+
+def observations_to_array(observations):
+    """Turn a list of dicts, a list of rows or an (n, 4) array into an (n, 4) float array"""
+    if isinstance(observations, pd.DataFrame):
+        rows = observations[WEATHER_FEATURES]
+    elif len(observations) and isinstance(observations[0], dict):
+        rows = [
+            [_observation_value(obs, feature, row) for feature in WEATHER_FEATURES]
+            for row, obs in enumerate(observations)
+        ]
+    else:
+        rows = observations
+    try:
+        array = np.asarray(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"Observations must be numbers ({', '.join(WEATHER_FEATURES)})")
+
+    if array.ndim != 2 or array.shape[1] != len(WEATHER_FEATURES):
+        raise ValueError(f"Expected observations with {len(WEATHER_FEATURES)} values ({', '.join(WEATHER_FEATURES)})")
+    if not np.isfinite(array).all():
+        bad_row = int(np.flatnonzero(~np.isfinite(array).all(axis=1))[0])
+        raise ValueError(f"Observation {bad_row} has a missing or non-numeric value")
+    return array
+
+
+def read_observations_csv(source):
+    """Read observations from CSV text or a file object with a header naming the feature columns"""
+    if isinstance(source, bytes):
+        source = source.decode('utf-8')
+    if isinstance(source, str):
+        source = io.StringIO(source)
+
+    frame = pd.read_csv(source)
+    frame.columns = [str(c).strip().lower() for c in frame.columns]
+    missing = [feature for feature in WEATHER_FEATURES if feature not in frame.columns]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+    return observations_to_array(frame.apply(pd.to_numeric, errors='coerce'))
+
+
+def scale_features(features, scaler):
+    """scaler.transform, computed directly for a fitted StandardScaler.
+
+    sklearn's input validation costs far more than the arithmetic on a few
+    rows; the result is identical.
+    """
+    if type(scaler).__name__ == 'StandardScaler' and scaler.with_mean and scaler.with_std:
+        return (features - scaler.mean_) / scaler.scale_
+    return scaler.transform(features)
+
+
+def model_probabilities(observations, scaler, weather_model):
+    """Softmax over DISEASE_CLASSES straight from the model: one transform, one model call"""
+    observations = np.asarray(observations, dtype=np.float64)
+    features = np.zeros((len(observations), len(WEATHER_FEATURES) + 1))
+    features[:, :len(WEATHER_FEATURES)] = observations
+    return np.asarray(weather_model.predict(scale_features(features, scaler)))
+
+
+def predict_disease_probabilities(observations, scaler, weather_model, grid=None):
+    """Softmax over DISEASE_CLASSES for every observation, from the risk grid where it covers them"""
+    observations = np.asarray(observations, dtype=np.float64)
+    if grid is None:
+        return model_probabilities(observations, scaler, weather_model)
+
+    inside = grid.contains(observations)
+    probabilities = np.empty((len(observations), len(DISEASE_CLASSES)), dtype=np.float32)
+    if inside.any():
+        probabilities[inside] = grid.lookup(observations[inside])
+    if not inside.all():
+        # Outside the grid: no extrapolation, ask the model
+        probabilities[~inside] = model_probabilities(observations[~inside], scaler, weather_model)
+    return probabilities
+
+
+def iter_disease_predictions(observations, scaler, weather_model, chunk_size=DISEASE_BATCH_CHUNK, grid=None):
+    """Yield (start row, class indices, confidences) for each chunk of observations"""
+    observations = observations_to_array(observations)
+    for start in range(0, len(observations), chunk_size):
+        probabilities = predict_disease_probabilities(observations[start:start + chunk_size], scaler, weather_model, grid)
+        indices = np.argmax(probabilities, axis=1)
+        yield start, indices, probabilities[np.arange(len(indices)), indices]
+
+
+def predict_diseases(observations, scaler, weather_model, chunk_size=DISEASE_BATCH_CHUNK, grid=None):
+    """Predicted disease and confidence for every observation, as a list of dicts"""
+    results = []
+    for _, indices, confidences in iter_disease_predictions(observations, scaler, weather_model, chunk_size, grid):
+        results.extend(
+            {'predicted_disease': DISEASE_CLASSES[i], 'confidence': float(c)}
+            for i, c in zip(indices, confidences)
+        )
+    return results
+
+
+# ============================================================================
+# FORECAST RISK TIMELINE
+# ============================================================================
+
+def _forecast_time(value, utc_offset=0):
+    """Local datetime of a forecast step given as unix seconds or an ISO string"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value + utc_offset, tz=timezone.utc).replace(tzinfo=None)
+    return datetime.fromisoformat(str(value))
+
+
+def forecast_observations(forecast):
+    """Times and (n, 4) observations of a forecast.
+
+    Accepts an OpenWeather /forecast response (3-hourly 'list' entries, rain in
+    mm per 3h, converted to mm/h like the current-weather rain['1h'] the app
+    already sends) or a plain list of {time, temp, humidity, wind_speed,
+    precipitation} rows.
+    """
+    if isinstance(forecast, dict) and 'list' in forecast:
+        times, rows = [], []
+        try:
+            utc_offset = forecast.get('city', {}).get('timezone', 0)
+            for step in forecast['list']:
+                rain = step.get('rain', {})
+                precipitation = rain.get('1h', rain.get('3h', 0) / 3.0)
+                times.append(_forecast_time(step['dt'], utc_offset))
+                rows.append([step['main']['temp'], step['main']['humidity'], step['wind']['speed'], precipitation])
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError("Every 'list' entry needs dt, main.temp, main.humidity and wind.speed")
+        observations = observations_to_array(rows)
+    else:
+        rows = forecast.get('forecast', []) if isinstance(forecast, dict) else forecast
+        try:
+            times = [_forecast_time(row['time']) for row in rows]
+        except (KeyError, TypeError):
+            # A missing 'time', or a row (or forecast) that isn't an object
+            raise ValueError("Every forecast row must be an object with a 'time'")
+        observations = observations_to_array(rows)
+
+    if len(times) == 0:
+        raise ValueError("Forecast has no time steps")
+    order = np.argsort(np.array(times, dtype='datetime64[s]'), kind='stable')
+    return [times[i] for i in order], observations[order]
+
+
+def forecast_risk(forecast, scaler, weather_model, grid=None, threshold=FORECAST_ALERT_THRESHOLD):
+    """Risk timeline per disease class over a whole forecast, scored in one batch.
+
+    Returns the per-step timeline, the highest probability of each class per
+    day, and an alert for every (disease, day) reaching the threshold.
+    """
+    times, observations = forecast_observations(forecast)
+    probabilities = predict_disease_probabilities(observations, scaler, weather_model, grid)
+    predicted = np.argmax(probabilities, axis=1)
+
+    timeline = [
+        {
+            'time': time.isoformat(),
+            'probabilities': dict(zip(DISEASE_CLASSES, map(float, row))),
+            'predicted_disease': DISEASE_CLASSES[index]
+        }
+        for time, row, index in zip(times, probabilities, predicted)
+    ]
+
+    # Steps are sorted, so each day is a contiguous run: reduce every run to its peak risk
+    days = np.array([time.date().toordinal() for time in times])
+    day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    daily_peak = np.maximum.reduceat(probabilities, day_starts, axis=0)
+
+    daily, alerts = [], []
+    for start, peak in zip(day_starts, daily_peak):
+        day = times[start].date()
+        daily.append({
+            'date': day.isoformat(),
+            'day': day.strftime('%A'),
+            'risk': dict(zip(DISEASE_CLASSES, map(float, peak)))
+        })
+        for disease, probability in zip(DISEASE_CLASSES, peak):
+            if disease != 'Healthy' and probability >= threshold:
+                alerts.append({
+                    'disease': disease,
+                    'date': day.isoformat(),
+                    'day': day.strftime('%A'),
+                    'probability': float(probability),
+                    'message': f"High {disease} risk {day.strftime('%A')} ({day.isoformat()}): {probability:.0%}"
+                })
+
+    return {'classes': DISEASE_CLASSES, 'timeline': timeline, 'daily': daily, 'alerts': alerts}
+
+
+# ============================================================================
+# PRECOMPUTED RISK GRID
+# ============================================================================
+
+def file_fingerprint(paths):
+    """Hash of the files a risk grid was computed from, to detect a stale grid"""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class RiskGrid:
+    """Model probabilities on a regular grid of the four inputs, multilinearly interpolated.
+
+    The table is an (n_temp, n_humidity, n_wind, n_precip, n_classes) float16
+    .npy file opened with mmap_mode='r', so workers share its pages and only
+    touch the cells they read.
+    """
+
+    def __init__(self, path=RISK_GRID_PATH):
+        self.path = path
+        with open(os.path.splitext(path)[0] + '.json') as f:
+            self.meta = json.load(f)
+        self.table = np.load(path, mmap_mode='r')
+        self.start = np.array([axis['start'] for axis in self.meta['axes']])
+        self.stop = np.array([axis['stop'] for axis in self.meta['axes']])
+        self.points = np.array([axis['points'] for axis in self.meta['axes']])
+        self.step = (self.stop - self.start) / (self.points - 1)
+
+        # Flat-index offsets and 0/1 axis flags of the 16 corners of a grid cell
+        strides = np.array([int(np.prod(self.points[d + 1:])) for d in range(len(self.points))])
+        self._corner_bits = np.array([
+            [(corner >> d) & 1 for d in range(len(self.points))]
+            for corner in range(1 << len(self.points))
+        ])
+        self._corner_offsets = self._corner_bits @ strides
+        self._strides = strides
+        self._flat = self.table.reshape(-1, self.table.shape[-1])
+
+        self.lookups = 0
+        self.fallbacks = 0
+
+    def contains(self, observations):
+        """Row mask of observations inside the grid"""
+        inside = np.all((observations >= self.start) & (observations <= self.stop), axis=1)
+        self.lookups += int(inside.sum())
+        self.fallbacks += int(len(inside) - inside.sum())
+        return inside
+
+    def lookup(self, observations):
+        """Interpolated probabilities for observations inside the grid"""
+        position = (observations - self.start) / self.step
+        lower = np.clip(np.floor(position).astype(np.intp), 0, self.points - 2)
+        frac = position - lower
+
+        # Weighted sum over the 16 corners of each observation's grid cell, gathered in one read
+        corners = (lower @ self._strides)[:, np.newaxis] + self._corner_offsets
+        weights = np.prod(
+            np.where(self._corner_bits, frac[:, np.newaxis, :], 1 - frac[:, np.newaxis, :]), axis=2
+        )
+        values = self._flat[corners.ravel()].reshape(corners.shape + (-1,)).astype(np.float32)
+        return np.einsum('nc,nck->nk', weights, values)
+
+    def is_current(self, source_paths):
+        """False when the model or scaler changed since the grid was built"""
+        return self.meta.get('fingerprint') == file_fingerprint(source_paths)
+
+    def stats(self):
+        return {
+            'points': int(np.prod(self.points)),
+            'lookups': self.lookups,
+            'fallbacks': self.fallbacks
+        }
+
+
+def build_risk_grid(scaler, weather_model, axes, path=RISK_GRID_PATH, source_paths=(), chunk_size=65536):
+    """Evaluate the model over a grid (axes: one (start, stop, points) per feature) and save it"""
+    values = [np.linspace(start, stop, int(points)) for start, stop, points in axes]
+    shape = tuple(len(v) for v in values)
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=np.float16, shape=shape + (len(DISEASE_CLASSES),))
+    flat = table.reshape(-1, len(DISEASE_CLASSES))
+
+    total = int(np.prod(shape))
+    for start in range(0, total, chunk_size):
+        index = np.unravel_index(np.arange(start, min(start + chunk_size, total)), shape)
+        observations = np.stack([v[i] for v, i in zip(values, index)], axis=1)
+        flat[start:start + len(observations)] = model_probabilities(observations, scaler, weather_model)
+    table.flush()
+    del table
+
+    meta = {
+        'features': WEATHER_FEATURES,
+        'classes': DISEASE_CLASSES,
+        'axes': [{'start': float(a), 'stop': float(b), 'points': int(n)} for a, b, n in axes],
+        'fingerprint': file_fingerprint(source_paths) if source_paths else None
+    }
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    return total
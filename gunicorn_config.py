@@ -1,21 +1,59 @@
 # Gunicorn configuration for memory-constrained environments
 import multiprocessing
 import os
+import time
 
 # Server socket - Railway provides PORT environment variable
 port = os.getenv("PORT", "10000")
 bind = f"0.0.0.0:{port}"
 
+# Pre-fork serving: load models once in the master and share them copy-on-write
+# with the workers. Only the TFLite backend is fork-safe (see preload_models_for_fork)
+preload_models = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
+if preload_models and os.getenv("MODEL_BACKEND", "keras").lower() != "tflite":
+    print("PRELOAD_MODELS needs MODEL_BACKEND=tflite (TensorFlow is not fork-safe); ignoring it")
+    preload_models = False
+
 # Worker processes
-workers = 1  # Use only 1 worker to minimize memory usage
-worker_class = "sync"
+# Use only 1 worker to minimize memory usage, unless models are shared pre-fork
+workers = int(os.getenv("WEB_CONCURRENCY", "4" if preload_models else "1"))
+# Threads let concurrent uploads reach the micro-batcher in the same process
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = "gthread"
 worker_connections = 1000
 timeout = 300  # Increased timeout for model loading (5 minutes)
 
 # Memory management
 max_requests = 100  # Restart workers after 100 requests to prevent memory leaks
 max_requests_jitter = 10
-preload_app = False  # Don't preload to avoid loading models at startup
+# Don't preload to avoid loading models at startup, unless PRELOAD_MODELS is set
+preload_app = preload_models
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported, before any worker is forked"""
+    if preload_models:
+        import gc
+        from app import preload_models_for_fork
+        preload_models_for_fork()
+        # Move everything loaded so far out of the GC's reach, so the collector
+        # in each worker doesn't write to (and un-share) those pages
+        gc.freeze()
+
+# Load and exercise the models in the background as soon as a worker boots,
+# so recycled workers (max_requests) never serve a request with a cold model
+warm_start = os.getenv("WARM_START", "true").lower() == "true"
+
+
+def post_fork(server, worker):
+    worker.boot_time = time.time()
+
+
+def post_worker_init(worker):
+    """Runs in each worker once the app is loaded, before it accepts requests"""
+    if warm_start:
+        from app import warm_start as start_warm_start
+        start_warm_start(boot_time=getattr(worker, "boot_time", None))
 
 # Logging
 accesslog = "-"
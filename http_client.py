@@ -0,0 +1,145 @@
+"""Shared outbound HTTP client for OpenWeather, Gemini and Groq.
+
+One requests.Session per process keeps connections to each host alive (a
+pool per host), so repeated calls skip the TCP and TLS handshakes. Every call
+gets default connect/read timeouts. Connection failures are retried with
+exponential backoff; GET calls are also retried on 429/5xx answers, honouring
+Retry-After. POSTs (paid LLM completions) are never re-sent once they reached
+the upstream. Latency and error counters are kept per upstream and reported
+by /health.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.5'))
+# Longest Retry-After worth waiting for; longer ones return the 429/503 to the caller
+HTTP_RETRY_AFTER_MAX = float(os.getenv('HTTP_RETRY_AFTER_MAX', '5'))
+# Kept-alive connections per host
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+
+# Counters are kept under these names, other hosts under their host name
+UPSTREAM_HOSTS = {
+    'api.openweathermap.org': 'openweather',
+    'generativelanguage.googleapis.com': 'gemini',
+    'api.groq.com': 'groq'
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class _UpstreamRetry(Retry):
+    """Retry that returns the response instead of waiting longer than HTTP_RETRY_AFTER_MAX"""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > HTTP_RETRY_AFTER_MAX:
+                # With raise_on_status=False the pool hands this response back to the caller
+                raise MaxRetryError(_pool, url, ResponseError(f"Retry-After {retry_after:g}s"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def _build_session():
+    retry = _UpstreamRetry(
+        total=HTTP_RETRIES,
+        # Connection errors happen before the request reaches the upstream, so any method is safe to retry
+        connect=HTTP_RETRIES,
+        # A read timeout means the upstream is already working on the request: raise it as a Timeout
+        read=False,
+        status=HTTP_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        # Status retries only for GET; a 429/5xx on a POST goes straight back to the caller
+        allowed_methods=frozenset(['GET']),
+        # Return the last 429/5xx response to the caller instead of raising
+        raise_on_status=False,
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=len(UPSTREAM_HOSTS) + 4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """The process's pooled session (created again after a fork, sockets must not be shared)"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def upstream_name(url):
+    host = urlsplit(url).hostname or ''
+    return UPSTREAM_HOSTS.get(host, host)
+
+
+def _record(upstream, seconds, failed):
+    with _stats_lock:
+        stats = _stats.setdefault(upstream, {'requests': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['requests'] += 1
+        stats['errors'] += int(failed)
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+
+def request(method, url, timeout=None, **kwargs):
+    """requests.request() through the pooled session, with default timeouts and counters.
+
+    Latency is measured until the response headers arrive (streamed bodies are
+    read afterwards). Responses with a 4xx/5xx status count as errors.
+    """
+    upstream = upstream_name(url)
+    started = time.perf_counter()
+    try:
+        response = get_session().request(
+            method, url, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), **kwargs
+        )
+    except requests.exceptions.RequestException:
+        _record(upstream, time.perf_counter() - started, failed=True)
+        raise
+    _record(upstream, time.perf_counter() - started, failed=response.status_code >= 400)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def stats():
+    """Per-upstream request, error and latency counters"""
+    with _stats_lock:
+        return {
+            upstream: {
+                'requests': s['requests'],
+                'errors': s['errors'],
+                'avg_ms': round(1000 * s['total_seconds'] / s['requests'], 1),
+                'max_ms': round(1000 * s['max_seconds'], 1)
+            }
+            for upstream, s in _stats.items()
+        }
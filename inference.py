@@ -0,0 +1,343 @@
+"""Inference-only model wrappers used by the prediction endpoints.
+
+Two backends are available, selected with MODEL_BACKEND:
+
+- keras:  the .h5 model loaded without its training configuration and run
+          through a traced tf.function with a fixed input signature
+- tflite: the .tflite export produced by convert_models.py, run with the
+          standalone TFLite interpreter so TensorFlow is never imported
+
+The image model additionally has an INT8 post-training quantized variant
+(GRAPE_MODEL_VARIANT=int8), which always runs on the TFLite interpreter.
+
+The keras backend keeps a snapshot of every traced model (a SavedModel with
+the weights and the concrete graph) in MODEL_SNAPSHOT_DIR. Later loads
+restore the snapshot instead of rebuilding the Keras model and re-tracing it.
+
+The small weather disease model can also run without any ML framework
+(backend numpy): convert_models.py exports its dense-layer weights to an
+.npz file that NumpyDenseModel evaluates with plain matrix products.
+
+All of them expose the same predict(batch) -> numpy array contract.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'keras').lower()
+# float (default) or int8 - the int8 variant is always served through TFLite
+GRAPE_MODEL_VARIANT = os.getenv('GRAPE_MODEL_VARIANT', 'float').lower()
+# Where traced keras models are cached between restarts (empty disables snapshots)
+MODEL_SNAPSHOT_DIR = os.getenv('MODEL_SNAPSHOT_DIR', 'model_cache')
+
+
+class GraphModel:
+    """Run a Keras model as a traced, inference-only tf.function"""
+
+    def __init__(self, keras_model, name='model'):
+        import tensorflow as tf
+
+        self.keras_model = keras_model
+        self.name = name
+        self.input_shape = tuple(keras_model.input_shape[1:])
+
+        # Only the batch dimension is left open so the graph is traced once
+        signature = [tf.TensorSpec(shape=(None,) + self.input_shape, dtype=tf.float32)]
+        self._forward = tf.function(
+            lambda x: keras_model(x, training=False),
+            input_signature=signature
+        )
+
+    def predict(self, x, **kwargs):
+        """Same contract as keras Model.predict: numpy batch in, numpy batch out"""
+        x = np.asarray(x, dtype=np.float32)
+        return self._forward(x).numpy()
+
+    def __call__(self, x):
+        return self.predict(x)
+
+    def warmup(self):
+        """Trace the graph with a dummy batch so the first request doesn't pay for it"""
+        start = time.perf_counter()
+        self.predict(np.zeros((1,) + self.input_shape, dtype=np.float32))
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{self.name} graph traced in {elapsed:.1f} ms")
+
+
+class SnapshotModel:
+    """Run a traced graph restored from a SavedModel snapshot (see export_snapshot)"""
+
+    def __init__(self, snapshot_dir, name='model'):
+        import tensorflow as tf
+
+        self.name = name
+        self.path = snapshot_dir
+        # Keep the loaded object alive: the signature only holds weak references to its variables
+        self._loaded = tf.saved_model.load(snapshot_dir)
+        self._signature = self._loaded.signatures['serving_default']
+        _, inputs = self._signature.structured_input_signature
+        self._input_name, spec = next(iter(inputs.items()))
+        self.input_shape = tuple(spec.shape[1:])
+
+    def predict(self, x, **kwargs):
+        x = np.asarray(x, dtype=np.float32)
+        outputs = self._signature(**{self._input_name: x})
+        return next(iter(outputs.values())).numpy()
+
+    def __call__(self, x):
+        return self.predict(x)
+
+    def warmup(self):
+        """Run a dummy batch so the first request doesn't pay for graph initialisation"""
+        start = time.perf_counter()
+        self.predict(np.zeros((1,) + self.input_shape, dtype=np.float32))
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{self.name} snapshot warmed up in {elapsed:.1f} ms")
+
+
+def snapshot_path(path, snapshot_dir=None):
+    """Directory of the SavedModel snapshot kept for an .h5 model"""
+    base = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(snapshot_dir or MODEL_SNAPSHOT_DIR, base + '.savedmodel')
+
+
+def snapshot_is_fresh(path, snapshot_dir=None):
+    """True when a snapshot exists and was written after the .h5 it came from"""
+    snapshot = snapshot_path(path, snapshot_dir)
+    return os.path.isdir(snapshot) and os.path.getmtime(snapshot) >= os.path.getmtime(path)
+
+
+def export_snapshot(graph_model, path, snapshot_dir=None):
+    """Save a GraphModel's weights and traced graph as a SavedModel snapshot"""
+    import shutil
+    import tensorflow as tf
+
+    snapshot = snapshot_path(path, snapshot_dir)
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+
+    module = tf.Module()
+    module.model = graph_model.keras_model
+    concrete = graph_model._forward.get_concrete_function()
+
+    # Written next to the final location and renamed into place, so a worker
+    # booting concurrently never sees a half-written snapshot
+    tmp = f"{snapshot}.tmp-{os.getpid()}"
+    tf.saved_model.save(module, tmp, signatures={'serving_default': concrete})
+    if os.path.isdir(snapshot):
+        shutil.rmtree(snapshot, ignore_errors=True)
+    try:
+        os.rename(tmp, snapshot)
+    except OSError:
+        # Another process renamed its copy first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return snapshot
+
+
+def load_keras_model(path, name, snapshot_dir=None):
+    """Load a keras model from its snapshot if it is up to date, else from the .h5 (and snapshot it)"""
+    snapshot_dir = MODEL_SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir
+
+    if snapshot_dir and snapshot_is_fresh(path, snapshot_dir):
+        try:
+            start = time.perf_counter()
+            snapshot_model = SnapshotModel(snapshot_path(path, snapshot_dir), name=name)
+            print(f"{name} restored from snapshot in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return snapshot_model
+        except Exception as e:
+            print(f"Error loading {name} snapshot, falling back to {path}: {e}")
+
+    from tensorflow.keras.models import load_model
+
+    graph_model = GraphModel(load_model(path, compile=False), name=name)
+    if snapshot_dir:
+        try:
+            print(f"{name} snapshot written to {export_snapshot(graph_model, path, snapshot_dir)}")
+        except Exception as e:
+            print(f"Error writing {name} snapshot: {e}")
+    return graph_model
+
+
+def _softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+# Keras activations NumpyDenseModel can evaluate (convert_models.py refuses anything else)
+DENSE_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': _softmax
+}
+
+
+class NumpyDenseModel:
+    """Evaluate a stack of dense layers exported by convert_models.py with NumPy only.
+
+    The .npz holds a 'layers' array of '<kind>:<activation>' specs and, per
+    layer i, W{i}/b{i} (dense), scale{i}/offset{i} (affine: a folded batch
+    normalization) or nothing (activation).
+    """
+
+    def __init__(self, path, name='model'):
+        self.name = name
+        self.path = path
+        with np.load(path) as weights:
+            self._layers = []
+            for i, spec in enumerate(weights['layers']):
+                kind, activation = str(spec).split(':')
+                if kind == 'dense':
+                    params = (weights[f'W{i}'], weights[f'b{i}'])
+                elif kind == 'affine':
+                    params = (weights[f'scale{i}'], weights[f'offset{i}'])
+                else:
+                    params = None
+                self._layers.append((kind, params, DENSE_ACTIVATIONS[activation]))
+            self.input_shape = tuple(int(d) for d in weights['input_shape'])
+
+    def predict(self, x, **kwargs):
+        x = np.asarray(x, dtype=np.float32)
+        for kind, params, activation in self._layers:
+            if kind == 'dense':
+                x = x @ params[0] + params[1]
+            elif kind == 'affine':
+                x = x * params[0] + params[1]
+            x = activation(x)
+        return x
+
+    def __call__(self, x):
+        return self.predict(x)
+
+    def warmup(self):
+        """Nothing to trace or allocate, kept for the common loader contract"""
+
+
+def dense_weights_path(path):
+    """Path of the .npz weight export that convert_models.py writes for an .h5 model"""
+    return os.path.splitext(path)[0] + '.npz'
+
+
+def _tflite_interpreter_class():
+    """Find a TFLite interpreter, preferring the runtimes that don't pull in TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    # Last resort: the interpreter bundled with TensorFlow
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """Run a .tflite export with the same predict() contract as GraphModel"""
+
+    def __init__(self, path, name='model', num_threads=None):
+        self.name = name
+        self.path = path
+        self.num_threads = num_threads
+        # A TFLite interpreter must not be invoked from two threads at once
+        self._lock = threading.Lock()
+        self._open()
+        self.input_shape = tuple(int(d) for d in self._input['shape'][1:])
+
+    def _open(self):
+        """Create the interpreter; the .tflite file is mmapped, so its weights are shared between processes"""
+        Interpreter = _tflite_interpreter_class()
+        self._interpreter = Interpreter(model_path=self.path, num_threads=self.num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._pid = os.getpid()
+
+    def close(self):
+        """Drop the interpreter and its tensor arena; the next predict() opens a new one"""
+        with self._lock:
+            self._interpreter = None
+            self._pid = None
+
+    def _resize(self, batch_size):
+        """Resize the input tensor only when the batch size actually changes"""
+        if batch_size != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input['index'], (batch_size,) + self.input_shape)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def _quantize(self, x):
+        """Map float inputs onto an integer input tensor (fully-quantized exports)"""
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return x
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, y):
+        if self._output['dtype'] == np.float32:
+            return y
+        scale, zero_point = self._output['quantization']
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict(self, x, **kwargs):
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Closed, or loaded before a fork: the inherited interpreter's thread pool is gone
+                self._open()
+            self._resize(x.shape[0])
+            self._interpreter.set_tensor(self._input['index'], self._quantize(x))
+            self._interpreter.invoke()
+            return self._dequantize(np.array(self._interpreter.get_tensor(self._output['index'])))
+
+    def __call__(self, x):
+        return self.predict(x)
+
+    def warmup(self):
+        """Run a dummy batch so the first request doesn't pay for tensor allocation"""
+        start = time.perf_counter()
+        self.predict(np.zeros((1,) + self.input_shape, dtype=np.float32))
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{self.name} TFLite interpreter warmed up in {elapsed:.1f} ms")
+
+
+def tflite_path(path, variant='float'):
+    """Path of the TFLite export that convert_models.py writes for an .h5 model"""
+    base = os.path.splitext(path)[0]
+    if variant == 'int8':
+        return base + '_int8.tflite'
+    return base + '.tflite'
+
+
+def load_inference_model(path, name=None, backend=None, variant='float', warmup=True):
+    """Load an .h5 model (or its TFLite export) for inference only and warm it up"""
+    backend = (backend or MODEL_BACKEND).lower()
+    name = name or path
+
+    if variant == 'int8':
+        inference_model = TFLiteModel(tflite_path(path, variant), name=f"{name} (int8)")
+    elif variant != 'float':
+        raise ValueError(f"Unknown model variant '{variant}' (expected 'float' or 'int8')")
+    elif backend == 'tflite':
+        inference_model = TFLiteModel(tflite_path(path), name=name)
+    elif backend == 'numpy':
+        inference_model = NumpyDenseModel(dense_weights_path(path), name=name)
+    elif backend == 'keras':
+        inference_model = load_keras_model(path, name)
+    else:
+        raise ValueError(f"Unknown MODEL_BACKEND '{backend}' (expected 'keras', 'tflite' or 'numpy')")
+
+    if warmup:
+        inference_model.warmup()
+    return inference_model
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""Out-of-process model execution for the web workers.
+
+The inference service runs the grape disease models in a pool of dedicated
+processes. Web workers send prediction requests to it over a local socket
+instead of running the models inside Flask request threads, so a slow
+forward pass never ties up a web worker serving cheap pages.
+
+Start it next to gunicorn on the same box:
+
+    python inference_service.py
+
+and point the web app at it with INFERENCE_SERVICE_ADDRESS=127.0.0.1:6001.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+
+INFERENCE_SERVICE_ADDRESS = os.getenv('INFERENCE_SERVICE_ADDRESS', '')
+# Shared secret of the service and the web workers. Required: connections carry pickled
+# messages, so anyone who can authenticate can run code in the service
+INFERENCE_SERVICE_AUTHKEY = os.getenv('INFERENCE_SERVICE_AUTHKEY', '').encode()
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+# Requests allowed to wait for a model process before new ones are rejected
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '64'))
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '30'))
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '32'))
+# /health shows service stats at most this old (refreshed in the background)
+INFERENCE_STATS_INTERVAL = float(os.getenv('INFERENCE_STATS_INTERVAL', '5'))
+
+# Model files served by the pool, by request kind
+MODEL_PATHS = {
+    'grape': 'grape_model.h5',
+    'weather': 'grape_leaf_disease_model.h5'
+}
+
+
+class InferenceServiceError(Exception):
+    """The inference service could not answer a request"""
+
+
+class InferenceBusy(InferenceServiceError):
+    """The request queue is full (backpressure)"""
+
+
+class InferenceTimeout(InferenceServiceError):
+    """No answer within the per-request timeout"""
+
+
+def require_authkey():
+    if not INFERENCE_SERVICE_AUTHKEY:
+        raise ValueError(
+            "INFERENCE_SERVICE_AUTHKEY must be set (the same random secret for the inference service and the app)"
+        )
+    return INFERENCE_SERVICE_AUTHKEY
+
+
+def parse_address(address):
+    """'host:port' becomes a TCP address, anything else is a unix socket path"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return address
+
+
+# ============================================================================
+# SERVICE SIDE
+# ============================================================================
+
+def _model_worker(task_queue, result_queue, max_batch):
+    """Model process: load the models once, then run queued requests in batches"""
+    from inference import load_inference_model, GRAPE_MODEL_VARIANT
+
+    models = {
+        'grape': load_inference_model(MODEL_PATHS['grape'], name='grape_model', variant=GRAPE_MODEL_VARIANT),
+        'weather': load_inference_model(MODEL_PATHS['weather'], name='weather_model')
+    }
+    print(f"Inference worker {os.getpid()} ready")
+
+    deferred = []
+    while True:
+        task = deferred.pop(0) if deferred else task_queue.get()
+
+        # Take whatever else is already waiting for the same model, up to max_batch rows
+        batch = [task]
+        rows = len(task['inputs'])
+        while rows < max_batch:
+            try:
+                extra = task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if extra['kind'] == task['kind']:
+                batch.append(extra)
+                rows += len(extra['inputs'])
+            else:
+                deferred.append(extra)
+
+        # Callers that already gave up don't get a forward pass
+        now = time.time()
+        live = []
+        for t in batch:
+            if t['deadline'] < now:
+                result_queue.put((t['conn'], t['id'], None, 'timeout'))
+            else:
+                live.append(t)
+        if not live:
+            continue
+
+        try:
+            outputs = models[task['kind']].predict(np.concatenate([t['inputs'] for t in live], axis=0))
+            offset = 0
+            for t in live:
+                rows = len(t['inputs'])
+                result_queue.put((t['conn'], t['id'], outputs[offset:offset + rows], None))
+                offset += rows
+        except Exception as e:
+            for t in live:
+                result_queue.put((t['conn'], t['id'], None, str(e)))
+
+
+class InferenceService:
+    """Accept requests from web workers and fan them out to the model processes"""
+
+    def __init__(self, address, workers=INFERENCE_WORKERS, queue_size=INFERENCE_QUEUE_SIZE,
+                 max_batch=INFERENCE_MAX_BATCH):
+        self.address = parse_address(address)
+        self.authkey = require_authkey()
+        # spawn, not fork: every model process gets a clean TensorFlow runtime
+        ctx = mp.get_context('spawn')
+        self.task_queue = ctx.Queue(maxsize=queue_size)
+        self.result_queue = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=_model_worker, args=(self.task_queue, self.result_queue, max_batch), daemon=True)
+            for _ in range(workers)
+        ]
+        self.queue_size = queue_size
+
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._conn_ids = itertools.count()
+
+        # Metrics
+        self.queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def stats(self):
+        return {
+            'workers': len(self.processes),
+            'alive_workers': sum(p.is_alive() for p in self.processes),
+            'queue_depth': self.queue_depth,
+            'queue_size': self.queue_size,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
+
+    def _send(self, conn_id, message):
+        with self._lock:
+            entry = self._connections.get(conn_id)
+        if entry is None:
+            return
+        conn, send_lock = entry
+        try:
+            with send_lock:
+                conn.send(message)
+        except (OSError, EOFError):
+            pass
+
+    def _dispatch_results(self):
+        """Route model outputs back to the connection that asked for them"""
+        while True:
+            conn_id, request_id, outputs, error = self.result_queue.get()
+            with self._lock:
+                self.queue_depth -= 1
+                if error == 'timeout':
+                    self.timed_out += 1
+                else:
+                    self.completed += 1
+            self._send(conn_id, {'id': request_id, 'outputs': outputs, 'error': error})
+
+    def _handle_connection(self, conn_id, conn):
+        try:
+            while True:
+                message = conn.recv()
+                if message.get('kind') == 'stats':
+                    self._send(conn_id, {'id': message['id'], 'stats': self.stats(), 'error': None})
+                    continue
+
+                task = {
+                    'conn': conn_id,
+                    'id': message['id'],
+                    'kind': message['kind'],
+                    'inputs': message['inputs'],
+                    'deadline': time.time() + message.get('timeout', INFERENCE_TIMEOUT)
+                }
+                # Counted before the put, so the result dispatcher can never decrement it first
+                with self._lock:
+                    self.queue_depth += 1
+                try:
+                    self.task_queue.put_nowait(task)
+                except queue.Full:
+                    # Backpressure: fail fast instead of letting the queue grow without bound
+                    with self._lock:
+                        self.queue_depth -= 1
+                        self.rejected += 1
+                    self._send(conn_id, {'id': message['id'], 'outputs': None, 'error': 'busy'})
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.pop(conn_id, None)
+            conn.close()
+
+    def serve_forever(self):
+        for process in self.processes:
+            process.start()
+        threading.Thread(target=self._dispatch_results, name='inference-results', daemon=True).start()
+
+        # A generous backlog: every web worker thread may connect at once after a restart
+        with Listener(self.address, backlog=128, authkey=self.authkey) as listener:
+            print(f"Inference service listening on {self.address} with {len(self.processes)} model processes")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError) as e:
+                    print(f"Inference service rejected a connection: {e}")
+                    continue
+                conn_id = next(self._conn_ids)
+                with self._lock:
+                    self._connections[conn_id] = (conn, threading.Lock())
+                threading.Thread(target=self._handle_connection, args=(conn_id, conn), daemon=True).start()
+
+
+# ============================================================================
+# WEB WORKER SIDE
+# ============================================================================
+
+class InferenceClient:
+    """Send prediction requests from a web worker to the inference service"""
+
+    def __init__(self, address=INFERENCE_SERVICE_ADDRESS, timeout=INFERENCE_TIMEOUT):
+        self.address = parse_address(address)
+        self.authkey = require_authkey()
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._pool = None
+        self._pid = None
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.busy = 0
+        self.timeouts = 0
+        self.errors = 0
+        # Last service stats, so /health never waits on the service
+        self._service_stats = None
+        self._service_stats_at = 0.0
+        self._refreshing = False
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _checkout(self):
+        # Connections must not be shared with a forked child
+        if self._pid != os.getpid():
+            self._pool = queue.LifoQueue()
+            self._pid = os.getpid()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return Client(self.address, authkey=self.authkey)
+
+    def _request(self, message, timeout):
+        try:
+            conn = self._checkout()
+        except OSError as e:
+            self._count('errors')
+            raise InferenceServiceError(f"Inference service unavailable: {e}")
+
+        try:
+            conn.send(message)
+            # A reply is only read for the request just sent; a connection that timed
+            # out may still receive a late answer, so it is closed rather than reused
+            if not conn.poll(timeout):
+                conn.close()
+                self._count('timeouts')
+                raise InferenceTimeout(f"No answer from the inference service within {timeout:.0f}s")
+            reply = conn.recv()
+        except (EOFError, OSError) as e:
+            conn.close()
+            self._count('errors')
+            raise InferenceServiceError(f"Inference service connection lost: {e}")
+
+        self._pool.put(conn)
+        return reply
+
+    def predict(self, kind, inputs, timeout=None):
+        timeout = timeout or self.timeout
+        self._count('requests')
+        reply = self._request({
+            'id': next(self._ids),
+            'kind': kind,
+            'inputs': np.asarray(inputs, dtype=np.float32),
+            'timeout': timeout
+        }, timeout)
+
+        error = reply.get('error')
+        if error == 'busy':
+            self._count('busy')
+            raise InferenceBusy("Inference service is busy, please retry")
+        if error == 'timeout':
+            self._count('timeouts')
+            raise InferenceTimeout("Inference request expired in the queue")
+        if error:
+            self._count('errors')
+            raise InferenceServiceError(error)
+        return reply['outputs']
+
+    def _refresh_service_stats(self):
+        try:
+            service = self._request({'id': next(self._ids), 'kind': 'stats'}, 2.0)['stats']
+        except InferenceServiceError as e:
+            service = {'error': str(e)}
+        with self._lock:
+            self._service_stats = service
+            self._service_stats_at = time.time()
+            self._refreshing = False
+
+    def stats(self):
+        """Client counters plus the last known service stats (refreshed in the background, never waited for)"""
+        with self._lock:
+            stats = {'requests': self.requests, 'busy': self.busy, 'timeouts': self.timeouts, 'errors': self.errors}
+            stats['service'] = self._service_stats
+            stale = time.time() - self._service_stats_at > INFERENCE_STATS_INTERVAL
+            refresh = stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        if refresh:
+            threading.Thread(target=self._refresh_service_stats, name='inference-stats', daemon=True).start()
+        return stats
+
+
+class RemoteModel:
+    """Model proxy with the same predict() contract as the in-process backends"""
+
+    def __init__(self, client, kind, name=None):
+        self.client = client
+        self.kind = kind
+        self.name = name or kind
+
+    def predict(self, x, **kwargs):
+        return self.client.predict(self.kind, x)
+
+    def __call__(self, x):
+        return self.predict(x)
+
+
+if __name__ == '__main__':
+    InferenceService(INFERENCE_SERVICE_ADDRESS or '127.0.0.1:6001').serve_forever()
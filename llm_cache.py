@@ -0,0 +1,190 @@
+"""Persistent cache for generated text (Gemini variety descriptions and advice).
+
+Entries are keyed by subject, prompt template and model name, so changing
+the prompt or the model starts a fresh set of entries. They are stored in a
+MongoDB collection or as JSON files on local disk, with a bounded in-process
+copy (least recently used entries evicted first) in front. An entry older than the TTL is still answered immediately, and a
+background refresh replaces it (stale-while-revalidate).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# mongo (shared by every worker, the default with MONGO_URI), disk (LLM_CACHE_DIR, the default
+# without it) or memory (per worker, lost whenever a worker is recycled)
+LLM_CACHE_BACKEND = os.getenv('LLM_CACHE_BACKEND', 'mongo' if os.getenv('MONGO_URI') else 'disk').lower()
+LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', 'llm_cache')
+# Entries kept in each worker's memory
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '1024'))
+# Age after which an entry is refreshed in the background (default 30 days)
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(30 * 24 * 3600)))
+# Concurrent background generations (refreshes and prewarming)
+LLM_CACHE_REFRESH_WORKERS = int(os.getenv('LLM_CACHE_REFRESH_WORKERS', '2'))
+
+
+def text_key(subject, template, model_name):
+    """Cache key of one generated text"""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in (subject, template, model_name):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class TextCache:
+    """Generated texts with TTL refresh, stored in MongoDB, on disk or in memory"""
+
+    def __init__(self, collection=None, directory=None, ttl=LLM_CACHE_TTL, refresh_workers=LLM_CACHE_REFRESH_WORKERS,
+                 max_entries=LLM_CACHE_SIZE):
+        self.collection = collection
+        self.directory = directory
+        self.ttl = ttl
+        self.refresh_workers = refresh_workers
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _background(self):
+        """Executor for refreshes (created again after a fork, threads don't survive it)"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix='llm-cache')
+                self._pid = os.getpid()
+                self._refreshing = set()
+            return self._executor
+
+    # ------------------------------------------------------------------ storage
+
+    def _load(self, key):
+        """(text, updated_at) from the in-process copy or the persistent store"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            return entry
+
+        entry = None
+        try:
+            if self.collection is not None:
+                doc = self.collection.find_one({'_id': key})
+                if doc is not None:
+                    entry = (doc['text'], doc['updated_at'])
+            elif self.directory:
+                path = os.path.join(self.directory, key + '.json')
+                if os.path.exists(path):
+                    with open(path) as f:
+                        doc = json.load(f)
+                    entry = (doc['text'], doc['updated_at'])
+        except Exception as e:
+            print(f"Error reading LLM cache: {e}")
+
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _store(self, key, text, subject, model_name):
+        entry = (text, time.time())
+        self._remember(key, entry)
+        doc = {'_id': key, 'text': text, 'updated_at': entry[1], 'subject': subject, 'model': model_name}
+        try:
+            if self.collection is not None:
+                self.collection.replace_one({'_id': key}, doc, upsert=True)
+            elif self.directory:
+                path = os.path.join(self.directory, key + '.json')
+                tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+                with open(tmp, 'w') as f:
+                    json.dump(doc, f)
+                os.replace(tmp, path)
+        except Exception as e:
+            print(f"Error writing LLM cache: {e}")
+
+    # ------------------------------------------------------------------ lookups
+
+    def _refresh(self, key, subject, template, model_name, generate):
+        try:
+            self._store(key, generate(), subject, model_name)
+            self.refreshes += 1
+        except Exception as e:
+            # Keep serving the old text; the next stale hit tries again
+            self.errors += 1
+            print(f"Error refreshing cached text for '{subject}': {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key, subject, template, model_name, generate):
+        executor = self._background()
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        executor.submit(self._refresh, key, subject, template, model_name, generate)
+
+    def get_or_generate(self, subject, template, model_name, generate):
+        """Cached text for (subject, template, model); generate() only runs on a miss.
+
+        Stale entries are returned as they are and refreshed in the background.
+        Errors from generate() on a miss propagate to the caller.
+        """
+        key = text_key(subject, template, model_name)
+        entry = self._load(key)
+        if entry is not None:
+            text, updated_at = entry
+            if time.time() - updated_at < self.ttl:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._schedule_refresh(key, subject, template, model_name, generate)
+            return text
+
+        self.misses += 1
+        text = generate()
+        self._store(key, text, subject, model_name)
+        return text
+
+    def prewarm(self, subject, template, model_name, generate):
+        """Generate an entry missing from the persistent store in the background.
+
+        Stale entries are left to the refresh on their next lookup, and a memory-only
+        cache is not prewarmed: every recycled worker would pay for the same calls again.
+        """
+        if self.collection is None and not self.directory:
+            return
+        key = text_key(subject, template, model_name)
+        if self._load(key) is None:
+            self._schedule_refresh(key, subject, template, model_name, generate)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'size': len(self._entries)
+        }
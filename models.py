@@ -36,8 +36,8 @@ def serialize_mongo_doc(doc):
     
     return doc
 
-# MongoDB Connection
-client = MongoClient(os.getenv('MONGO_URI'))
+# MongoDB Connection (connects on first use, so a preloading gunicorn master forks no client threads)
+client = MongoClient(os.getenv('MONGO_URI'), connect=False)
 db = client["farm_planner"]
 
 # Collections
@@ -561,6 +561,3 @@ def get_farm_details_by_id(farm_id):
     except Exception as e:
         print(f"Error in get_farm_details_by_id: {str(e)}")
         return None
-
-# Initialize database
-init_grape_varieties() 
\ No newline at end of file
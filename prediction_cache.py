@@ -0,0 +1,130 @@
+"""Content-hash cache for grape leaf predictions.
+
+Entries are keyed by a hash of the decoded image pixels and of the model
+configuration that produced them (see model_identity), kept in a bounded
+in-process LRU and, optionally, in a shared MongoDB collection so every
+gunicorn worker sees the same entries.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '1024'))
+# memory (per worker) or mongo (shared across workers)
+PREDICTION_CACHE_BACKEND = os.getenv('PREDICTION_CACHE_BACKEND', 'memory').lower()
+PREDICTION_CACHE_TTL = int(os.getenv('PREDICTION_CACHE_TTL', str(7 * 24 * 3600)))
+
+
+def model_identity(settings, paths=()):
+    """Short id of a model configuration: its settings plus the size and mtime of each model file.
+
+    Workers with a different variant, backend or TTA mode, or with a redeployed model
+    file, get a different id and never read each other's cached predictions.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for setting in settings:
+        digest.update(str(setting).encode('utf-8'))
+        digest.update(b'\0')
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+        except OSError:
+            digest.update(f"{path}:missing".encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def image_key(image, model_id=''):
+    """Content hash of a decoded image array (shape is part of the key) for one model configuration"""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(model_id.encode('utf-8'))
+    digest.update(str(image.shape).encode())
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Bounded LRU of prediction payloads with an optional shared MongoDB tier"""
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, collection=None, ttl=PREDICTION_CACHE_TTL):
+        self.max_entries = max(1, int(max_entries))
+        self.collection = collection
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._indexed_pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def _shared(self):
+        """The MongoDB collection, indexed on first use in each process.
+
+        Nothing touches MongoDB when the cache is built, so a preloading gunicorn
+        master forks its workers without a connected client.
+        """
+        if self.collection is not None and self._indexed_pid != os.getpid():
+            self._indexed_pid = os.getpid()
+            try:
+                # MongoDB removes shared entries on its own once they expire
+                self.collection.create_index('created_at', expireAfterSeconds=self.ttl)
+            except Exception as e:
+                print(f"Error creating prediction cache index: {e}")
+        return self.collection
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+
+        if self.collection is not None:
+            try:
+                doc = self._shared().find_one({'_id': key})
+            except Exception as e:
+                print(f"Error reading prediction cache: {e}")
+                doc = None
+            if doc is not None:
+                self._remember(key, doc['payload'])
+                with self._lock:
+                    self.hits += 1
+                return doc['payload']
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, payload):
+        self._remember(key, payload)
+        if self.collection is not None:
+            try:
+                self._shared().replace_one(
+                    {'_id': key},
+                    {'_id': key, 'payload': payload, 'created_at': datetime.utcnow()},
+                    upsert=True
+                )
+            except Exception as e:
+                print(f"Error writing prediction cache: {e}")
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters returned with every prediction"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries)
+        }
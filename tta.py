@@ -0,0 +1,71 @@
+"""Test-time augmentation for the grape leaf classifier.
+
+Ambiguous photos (first-pass confidence below TTA_CONFIDENCE_THRESHOLD) are
+re-scored on flipped, rotated and cropped views of the same preprocessed
+image. All views of all ambiguous images go through the model as a single
+batch and the softmax outputs are averaged with the first pass.
+"""
+import os
+
+import cv2
+import numpy as np
+
+
+# off (default) or auto - auto runs TTA only on low-confidence predictions
+TTA_MODE = os.getenv('TTA_MODE', 'off').lower()
+TTA_CONFIDENCE_THRESHOLD = float(os.getenv('TTA_CONFIDENCE_THRESHOLD', '0.6'))
+
+# Side of the centre crop relative to the full image
+TTA_CROP_FRACTION = 0.85
+
+# Views added on top of the original image (the first pass is reused for it)
+TTA_VIEW_NAMES = ['hflip', 'vflip', 'rot90', 'rot180', 'rot270', 'crop', 'crop_hflip']
+
+
+def _center_crop(image, fraction=TTA_CROP_FRACTION):
+    """Crop the centre of an HxWxC image and scale it back to HxW"""
+    height, width = image.shape[:2]
+    crop_h, crop_w = int(round(height * fraction)), int(round(width * fraction))
+    top, left = (height - crop_h) // 2, (width - crop_w) // 2
+    crop = image[top:top + crop_h, left:left + crop_w]
+    return cv2.resize(crop, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def tta_views(images):
+    """Augmented views of a preprocessed (N, H, W, C) batch.
+
+    Returns an (N * len(TTA_VIEW_NAMES), H, W, C) batch with the views of each
+    image stored next to each other. Leaves have no natural orientation, so
+    the (square) model inputs are also rotated.
+    """
+    images = np.asarray(images, dtype=np.float32)
+    views = []
+    for image in images:
+        crop = _center_crop(image)
+        views.extend([
+            image[:, ::-1],
+            image[::-1, :],
+            np.rot90(image, 1),
+            np.rot90(image, 2),
+            np.rot90(image, 3),
+            crop,
+            crop[:, ::-1]
+        ])
+    return np.ascontiguousarray(np.stack(views))
+
+
+def needs_tta(pred, threshold=TTA_CONFIDENCE_THRESHOLD):
+    """True when a softmax row is too uncertain to be returned as is"""
+    return float(np.max(pred)) < threshold
+
+
+def tta_predict(predict_fn, images, first_pass):
+    """Average first-pass softmax rows with the model's outputs on augmented views.
+
+    predict_fn is called once, on the views of every image in the batch.
+    """
+    first_pass = np.asarray(first_pass, dtype=np.float32)
+    view_count = len(TTA_VIEW_NAMES)
+    view_preds = np.asarray(predict_fn(tta_views(images)), dtype=np.float32)
+    view_preds = view_preds.reshape(len(first_pass), view_count, -1)
+    return (first_pass + view_preds.sum(axis=1)) / (view_count + 1)
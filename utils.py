@@ -1,4 +1,3 @@
-import requests
 import json
 from datetime import datetime, timedelta
 import calendar
@@ -12,6 +11,8 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from dotenv import load_dotenv
 
+import http_client
+
 # Load environment variables
 load_dotenv()
 
@@ -21,7 +22,7 @@ def get_weather_data(city):
     API_KEY = os.getenv('OPENWEATHER_API_KEY')
     url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&units=metric&appid={API_KEY}"
     
-    response = requests.get(url)
+    response = http_client.get(url)
     if response.status_code == 200:
         return response.json()
     else:
@@ -33,7 +34,22 @@ def get_weather_data_by_coords(lat, lon):
     API_KEY = os.getenv('OPENWEATHER_API_KEY')
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&appid={API_KEY}"
     
-    response = requests.get(url)
+    response = http_client.get(url)
+    if response.status_code == 200:
+        return response.json()
+    else:
+        return None
+
+# OpenWeather API - Fetch the 5 day / 3 hour forecast by city name or coordinates
+def get_forecast_data(city=None, lat=None, lon=None):
+    """Fetch the multi-day weather forecast from OpenWeather API"""
+    API_KEY = os.getenv('OPENWEATHER_API_KEY')
+    if lat is not None and lon is not None:
+        url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&appid={API_KEY}"
+    else:
+        url = f"https://api.openweathermap.org/data/2.5/forecast?q={city}&units=metric&appid={API_KEY}"
+    
+    response = http_client.get(url)
     if response.status_code == 200:
         return response.json()
     else:
@@ -810,7 +826,6 @@ def generate_pdf_plan(farm_data, schedule_data):
 # Function to generate gemini-based recommendation (placeholder)
 def get_gemini_recommendation(grape_variety, location, query):
     """Get detailed recommendations for grape varieties using Google's Gemini API"""
-    import requests
     import json
     
     # Gemini API configuration
@@ -849,7 +864,7 @@ def get_gemini_recommendation(grape_variety, location, query):
     
     # Make API request
     try:
-        response = requests.post(
+        response = http_client.post(
             url,
             headers={"Content-Type": "application/json"},
             data=json.dumps(payload)
@@ -0,0 +1,252 @@
+"""NumPy fast path for the grape variety model (grape_variety_model.pkl).
+
+The pickled scikit-learn pipeline expects a pandas DataFrame and runs its
+whole preprocessing twice when predict() and predict_proba() are called one
+after the other. CompiledVarietyModel reads the fitted parameters of the
+preprocessing steps once, encodes plain dict rows with NumPy, and makes a
+single predict_proba call on the final estimator, from which the predicted
+variety is taken. Thousands of candidate sites are encoded and scored per call.
+
+Steps it cannot compile are served by the original pipeline instead.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Columns of the training data, in order (as built by /predictgrp)
+VARIETY_FEATURES = [
+    "Temperature (°C)", "Min Temperature (°C)", "Max Temperature (°C)", "Humidity (%)", "Pressure (hPa)",
+    "Weather Condition", "Wind Speed (m/s)", "Wind Direction (°)", "Soil pH", "Soil Moisture (%)",
+    "N (Nitrogen)", "P (Phosphorus)", "K (Potassium)", "Type of Soil"
+]
+
+
+class UnsupportedStep(Exception):
+    """A pipeline step that has no NumPy equivalent here"""
+
+
+def _compile_transformer(step, columns, categories):
+    """Return fn(dict of column arrays) -> 2-D float array for a fitted transformer"""
+    name = type(step).__name__
+
+    if step == 'passthrough':
+        return lambda cols: np.column_stack([np.asarray(cols[c], dtype=np.float64) for c in columns])
+
+    if name == 'Pipeline':
+        first = _compile_transformer(step.steps[0][1], columns, categories)
+        rest = [_compile_array_step(s) for _, s in step.steps[1:]]
+
+        def run(cols):
+            x = first(cols)
+            for fn in rest:
+                x = fn(x)
+            return x
+        return run
+
+    if name in ('OneHotEncoder', 'OrdinalEncoder'):
+        if getattr(step, 'infrequent_categories_', None) is not None and any(
+            c is not None for c in step.infrequent_categories_
+        ):
+            raise UnsupportedStep(f"{name} with infrequent categories")
+        lookups = [{category: i for i, category in enumerate(cats)} for cats in step.categories_]
+        categories.update(zip(columns, step.categories_))
+
+        def codes(cols):
+            return [
+                np.fromiter((lookup.get(v, -1) for v in cols[c]), dtype=np.intp, count=len(cols[c]))
+                for c, lookup in zip(columns, lookups)
+            ]
+
+        if name == 'OrdinalEncoder':
+            unknown = getattr(step, 'unknown_value', None)
+
+            def ordinal(cols):
+                out = np.column_stack(codes(cols)).astype(np.float64)
+                if (out < 0).any():
+                    if step.handle_unknown != 'use_encoded_value':
+                        raise ValueError("Unknown category in the variety model input")
+                    out[out < 0] = unknown
+                return out
+            return ordinal
+
+        drop_idx = getattr(step, 'drop_idx_', None)
+        # Columns kept per feature after OneHotEncoder's drop option
+        keep = [
+            np.array([i for i in range(len(cats)) if drop_idx is None or drop_idx[f] is None or i != drop_idx[f]])
+            for f, cats in enumerate(step.categories_)
+        ]
+
+        def one_hot(cols):
+            blocks = []
+            for code, kept, cats in zip(codes(cols), keep, step.categories_):
+                if (code < 0).any() and step.handle_unknown == 'error':
+                    raise ValueError("Unknown category in the variety model input")
+                block = np.zeros((len(code), len(cats)))
+                known = code >= 0
+                block[np.flatnonzero(known), code[known]] = 1.0
+                blocks.append(block[:, kept])
+            return np.hstack(blocks)
+        return one_hot
+
+    # Numeric transformers take the selected columns as a float matrix
+    array_step = _compile_array_step(step)
+    return lambda cols: array_step(
+        np.column_stack([np.asarray(cols[c], dtype=np.float64) for c in columns])
+    )
+
+
+def _compile_array_step(step):
+    """Return fn(2-D float array) -> 2-D float array for a fitted numeric transformer"""
+    name = type(step).__name__
+
+    if step == 'passthrough' or step is None:
+        return lambda x: x
+
+    if name == 'StandardScaler':
+        mean = step.mean_ if step.with_mean else 0.0
+        scale = step.scale_ if step.with_std else 1.0
+        return lambda x: (x - mean) / scale
+
+    if name == 'MinMaxScaler':
+        def min_max(x):
+            x = x * step.scale_ + step.min_
+            return np.clip(x, *step.feature_range) if getattr(step, 'clip', False) else x
+        return min_max
+
+    if name == 'SimpleImputer':
+        if getattr(step, 'add_indicator', False):
+            raise UnsupportedStep("SimpleImputer with add_indicator")
+        statistics = np.asarray(step.statistics_, dtype=np.float64)
+        return lambda x: np.where(np.isnan(x), statistics, x)
+
+    if name == 'Pipeline':
+        fns = [_compile_array_step(s) for _, s in step.steps]
+
+        def run(x):
+            for fn in fns:
+                x = fn(x)
+            return x
+        return run
+
+    raise UnsupportedStep(name)
+
+
+def _compile_column_transformer(transformer, feature_names, categories):
+    """Compile a fitted ColumnTransformer into fn(dict of column arrays) -> feature matrix"""
+    parts = []
+    for _, step, columns in transformer.transformers_:
+        if step == 'drop':
+            continue
+        if isinstance(columns, slice) or np.asarray(columns).dtype == bool:
+            raise UnsupportedStep("ColumnTransformer with slice/mask column selectors")
+        columns = [feature_names[c] if isinstance(c, (int, np.integer)) else c for c in np.atleast_1d(columns)]
+        if not columns:
+            continue
+        parts.append(_compile_transformer(step, columns, categories))
+    return lambda cols: np.hstack([part(cols) for part in parts])
+
+
+class CompiledVarietyModel:
+    """grape_variety_model.pkl with a NumPy feature encoder and one estimator call per batch"""
+
+    def __init__(self, pipeline, feature_names=None):
+        self.pipeline = pipeline
+        self.classes_ = pipeline.classes_
+        if feature_names is None:
+            feature_names = getattr(pipeline, 'feature_names_in_', VARIETY_FEATURES)
+        self.feature_names = list(feature_names)
+        self._encode = None
+        final_estimator = pipeline.steps[-1][1] if hasattr(pipeline, 'steps') else pipeline
+        # SVC's Platt-scaled probabilities can disagree with its predict(), so it keeps both calls
+        self._labels_from_proba = not hasattr(final_estimator, 'probability')
+        # Known values of every categorical column, used to build verification rows
+        self.categories = {}
+        try:
+            self._encode, self._estimator = self._compile(pipeline)
+        except Exception as e:
+            print(f"Variety model not compiled ({e}), using the scikit-learn pipeline")
+
+    def _compile(self, pipeline):
+        if type(pipeline).__name__ != 'Pipeline':
+            raise UnsupportedStep(type(pipeline).__name__)
+        steps = [step for _, step in pipeline.steps]
+        estimator = steps[-1]
+
+        first = steps[0]
+        if type(first).__name__ == 'ColumnTransformer':
+            encode_columns = _compile_column_transformer(first, self.feature_names, self.categories)
+        else:
+            encode_columns = _compile_transformer(first, self.feature_names, self.categories)
+        rest = [_compile_array_step(step) for step in steps[1:-1]]
+
+        def encode(cols):
+            x = encode_columns(cols)
+            for fn in rest:
+                x = fn(x)
+            return x
+        return encode, estimator
+
+    @property
+    def compiled(self):
+        return self._encode is not None
+
+    def _columns(self, rows):
+        """Dict rows (keys = training column names) to one array per column"""
+        return {
+            name: np.array([row[name] for row in rows], dtype=object)
+            for name in self.feature_names
+        }
+
+    def predict_with_proba(self, rows):
+        """Predicted variety and class probabilities for each row, in a single pass"""
+        if not self.compiled:
+            model, x = self.pipeline, pd.DataFrame(rows, columns=self.feature_names)
+        else:
+            model, x = self._estimator, self._encode(self._columns(rows))
+        probabilities = model.predict_proba(x)
+        if self._labels_from_proba:
+            return self.classes_[np.argmax(probabilities, axis=1)], probabilities
+        return model.predict(x), probabilities
+
+    def predict_many(self, rows, chunk_size=4096):
+        """predict_with_proba over any number of rows, chunk by chunk"""
+        labels, probabilities = [], []
+        for start in range(0, len(rows), chunk_size):
+            chunk_labels, chunk_probabilities = self.predict_with_proba(rows[start:start + chunk_size])
+            labels.append(chunk_labels)
+            probabilities.append(chunk_probabilities)
+        return np.concatenate(labels), np.concatenate(probabilities)
+
+    def probe_rows(self, count=16, seed=0):
+        """Synthetic rows covering every known category, for verify()"""
+        rng = np.random.default_rng(seed)
+        rows = []
+        for i in range(count):
+            row = {}
+            for name in self.feature_names:
+                if name in self.categories:
+                    known = self.categories[name]
+                    row[name] = known[i % len(known)]
+                else:
+                    row[name] = float(rng.uniform(0, 100))
+            rows.append(row)
+        return rows
+
+    def verify(self, rows=None, tolerance=1e-9):
+        """Compare the compiled path with the pipeline; switch back to the pipeline on a mismatch"""
+        if not self.compiled:
+            return True
+        rows = rows if rows is not None else self.probe_rows()
+        try:
+            expected = self.pipeline.predict_proba(pd.DataFrame(rows, columns=self.feature_names))
+            actual = self._estimator.predict_proba(self._encode(self._columns(rows)))
+            max_diff = float(np.max(np.abs(expected - actual)))
+        except Exception as e:
+            print(f"Could not verify the compiled variety model ({e}), using the pipeline")
+            self._encode = None
+            return False
+        if max_diff > tolerance:
+            print(f"Compiled variety model differs from the pipeline by {max_diff:.2e}, using the pipeline")
+            self._encode = None
+            return False
+        return True